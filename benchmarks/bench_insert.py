@@ -0,0 +1,62 @@
+"""
+Insert benchmark: the old per-match insert_match against bulk insert_matches.
+
+    python -m benchmarks.bench_insert --matches 500
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import aiosqlite
+
+from benchmarks.synthetic import generate_match, steam64
+from utils.database import COLUMNS, MATCH_HISTORY_DDL, close_db, init_db, insert_matches
+from utils.records import Match, parse_match
+
+async def legacy_insert(path: str, matches: list[Match]):
+    """What insert_match used to do: a fresh connection and commit per match."""
+    sql = (
+        f"INSERT OR REPLACE INTO match_history ({', '.join(COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(COLUMNS))})"
+    )
+    for match in matches:
+        async with aiosqlite.connect(path) as db:
+            await db.executemany(sql, match.rows)
+            await db.commit()
+
+async def run(count: int):
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    matches = [parse_match(generate_match(rng, [steam64(0)], start + timedelta(hours=i))) for i in range(count)]
+    rows = sum(len(match.rows) for match in matches)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, "before.db")
+        async with aiosqlite.connect(before_path) as db:
+            await db.execute(MATCH_HISTORY_DDL)
+            await db.commit()
+        t = time.perf_counter()
+        await legacy_insert(before_path, matches)
+        before = time.perf_counter() - t
+
+        await init_db(os.path.join(tmp, "after.db"))
+        t = time.perf_counter()
+        await insert_matches(matches)
+        after = time.perf_counter() - t
+        await close_db()
+
+    print(f"{count} matches, {rows} rows")
+    print(f"before (insert_match per match): {before:8.3f}s {rows / before:10.0f} rows/sec")
+    print(f"after  (insert_matches bulk):    {after:8.3f}s {rows / after:10.0f} rows/sec")
+    print(f"speedup: {before / after:.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--matches", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(args.matches))
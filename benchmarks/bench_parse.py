@@ -0,0 +1,129 @@
+"""
+Parse benchmark: decoding a large /v3/profile/matches response and turning
+it into match_history rows, the old dict walk against utils.records, plus
+ingest cost per match and peak memory.
+
+    python -m benchmarks.bench_parse --matches 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.synthetic import generate_history, steam64
+from utils.database import COLUMNS, close_db, init_db, insert_matches
+from utils.records import decode_matches, iso_to_unix, loads
+
+def legacy_rows(match: dict) -> list[tuple]:
+    """What match_rows did before records: a dict per player row."""
+    shared = {
+        "match_id": match["id"],
+        "finished_at": iso_to_unix(match["finished_at"]),
+        "data_source": match["data_source"],
+        "data_source_match_id": match.get("data_source_match_id"),
+        "map_name": match["map_name"],
+        "has_banned_player": int(match["has_banned_player"]),
+    }
+
+    # Build team score lookup
+    team_scores = {
+        team["team_number"]: team["score"]
+        for team in match.get("team_scores", [])
+    }
+
+    rows = []
+    for p in match["stats"]:
+        initial_team = p.get("initial_team_number")
+
+        team_score = team_scores.get(initial_team)
+        enemy_score = None
+        win = None
+
+        if team_score is not None and len(team_scores) == 2:
+            enemy_score = next(
+                score for team, score in team_scores.items()
+                if team != initial_team
+            )
+            win = int(team_score > enemy_score)
+
+        values = {
+            **shared,
+            "initial_team_number": initial_team,
+            "team_score": team_score,
+            "enemy_team_score": enemy_score,
+            "win": win,
+        }
+        rows.append(tuple(
+            values[name] if name in values else p.get(name)
+            for name in COLUMNS
+        ))
+
+    return rows
+
+
+def legacy_parse(body: bytes) -> list[list[tuple]]:
+    return [legacy_rows(match) for match in json.loads(body)]
+
+def measure(fn, body: bytes, repeat: int) -> tuple[float, float, float]:
+    """
+    (seconds per call, MiB held by the result, peak MiB while parsing).
+    orjson reserves a worst case buffer for the whole document up front,
+    which tracemalloc counts in full although most of it is never touched.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    result = fn(body)
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, held / 2**20, peak / 2**20
+
+async def ingest(body: bytes) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        await init_db(os.path.join(tmp, "bench.db"))
+        try:
+            start = time.perf_counter()
+            matches = decode_matches(body)
+            for i in range(0, len(matches), 100):
+                await insert_matches(matches[i:i + 100])
+            return time.perf_counter() - start
+        finally:
+            await close_db()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--matches", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    history = generate_history(rng, steam64(0), args.matches, end=datetime(2025, 1, 1, tzinfo=timezone.utc))
+    body = json.dumps(history).encode()
+    del history
+    n = args.matches
+
+    print(f"{n} matches, {len(body) / 2**20:.1f} MiB of JSON, decoder: {loads.__module__}")
+    for name, fn in (
+        ("json.loads only", json.loads),
+        ("fast loads only", loads),
+        ("before: json + dict rows", legacy_parse),
+        ("after: records", decode_matches),
+    ):
+        elapsed, held, peak = measure(fn, body, args.repeat)
+        print(f"  {name:<26} {elapsed / n * 1e6:8.1f} us/match  held {held:6.1f} MiB  peak {peak:6.1f} MiB")
+
+    elapsed = asyncio.run(ingest(body))
+    print(f"  {'decode + insert_matches':<26} {elapsed / n * 1e6:8.1f} us/match")
+
+if __name__ == "__main__":
+    main()
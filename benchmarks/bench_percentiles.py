@@ -0,0 +1,52 @@
+"""
+Percentile benchmark: the posted stats (STAT_COLUMNS) of one match against
+a large lobby, as the outbox does for every post.
+
+    python -m benchmarks.bench_percentiles --rows 300000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from utils.analytics import STAT_COLUMNS, ColumnIndex
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = rng.gamma(2.0, 10.0, size=(args.rows, len(STAT_COLUMNS))).astype(np.float32)
+    data[rng.random(data.shape) < 0.02] = np.nan  # some NULL stats
+    query = data[0].copy()
+
+    index = ColumnIndex()
+    start = time.perf_counter()
+    for offset in range(0, args.rows, 5000):
+        index.extend(data[offset:offset + 5000])
+    index.compact()
+    build = time.perf_counter() - start
+
+    columns = [np.sort(data[:, i]) for i in range(data.shape[1])]
+
+    def per_column():
+        return [np.searchsorted(column, value) for column, value in zip(columns, query)]
+
+    print(f"{args.rows:,} rows x {len(STAT_COLUMNS)} columns, {data.nbytes / 2**20:.0f} MiB, built in {build:.2f}s")
+    print(f"  full scan (data < value).mean      {timed(lambda: (data < query).mean(axis=0), 20) * 1e3:8.3f} ms")
+    print(f"  searchsorted per column            {timed(per_column, args.repeat) * 1e3:8.3f} ms")
+    print(f"  ColumnIndex.percentiles            {timed(lambda: index.percentiles(query), args.repeat) * 1e3:8.3f} ms")
+    index.extend(data[:1000])
+    print(f"  ColumnIndex.percentiles, 1k tail   {timed(lambda: index.percentiles(query), args.repeat) * 1e3:8.3f} ms")
+
+if __name__ == "__main__":
+    main()
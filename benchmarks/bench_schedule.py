@@ -0,0 +1,101 @@
+"""
+Schedule benchmark: fixed 15 minute polling against the adaptive per-player
+schedule, simulated over synthetic weeks of evening play sessions.
+
+    python -m benchmarks.bench_schedule --players 10 --weeks 4
+"""
+
+import argparse
+import bisect
+import math
+import random
+
+from utils.schedule import Activity, HOURS_PER_WEEK, hour_of_week
+
+WEEK = 7 * 24 * 3600
+TICK = 60  # check_leetify runs every minute
+
+def play_history(rng: random.Random, weeks: int) -> list[int]:
+    """Finish times for one player: 2-5 match sessions on their usual evenings, plus a few strays."""
+    days = rng.sample(range(7), rng.randint(2, 5))
+    start_hour = rng.randint(17, 21)
+    finished = []
+    for week in range(weeks):
+        for day in days:
+            if rng.random() > 0.8:
+                continue
+            t = week * WEEK + day * 86400 + start_hour * 3600 + rng.randint(0, 7200)
+            for _ in range(rng.randint(2, 5)):
+                t += rng.randint(35, 50) * 60
+                finished.append(t)
+        for _ in range(rng.randint(0, 2)):
+            finished.append(week * WEEK + rng.randint(0, WEEK))
+    return sorted(finished)
+
+def fixed(finished: list[int], start: int, end: int, interval: int = 900) -> tuple[int, list[int]]:
+    polls = list(range(start, end, interval))
+    return len(polls), latencies(finished, polls, start, end)
+
+def adaptive(finished: list[int], start: int, end: int) -> tuple[int, list[int]]:
+    # History before `start` is what the database already holds
+    seen = bisect.bisect_left(finished, start)
+    activity = Activity(weeks=start / WEEK)
+    for ts in finished[:seen]:
+        activity.hours[hour_of_week(ts)] += 1
+    activity.last_finished_at = finished[seen - 1] if seen else None
+
+    polls = []
+    t = start
+    while t < end:
+        polls.append(t)
+        # A poll stores everything that finished since the last one
+        while seen < len(finished) and finished[seen] <= t:
+            activity.hours[hour_of_week(finished[seen])] += 1
+            activity.last_finished_at = finished[seen]
+            seen += 1
+        activity.weeks = t / WEEK
+        t = math.ceil(activity.next_poll_at(t) / TICK) * TICK
+    return len(polls), latencies(finished, polls, start, end)
+
+def latencies(finished: list[int], polls: list[int], start: int, end: int) -> list[int]:
+    result = []
+    for ts in finished:
+        if start <= ts < end:
+            i = bisect.bisect_left(polls, ts)
+            if i < len(polls):
+                result.append(polls[i] - ts)
+    return result
+
+def report(name: str, calls: int, waits: list[int], weeks: int, players: int):
+    waits = sorted(waits)
+    p95 = waits[int(len(waits) * 0.95)] if waits else 0
+    print(
+        f"  {name:<10} {calls / weeks / players:7.0f} calls/player/week"
+        f"  post delay avg {sum(waits) / max(len(waits), 1) / 60:5.1f} min  p95 {p95 / 60:5.1f} min"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--weeks", type=int, default=4, help="Weeks measured, after as many weeks of history")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start, end = args.weeks * WEEK, 2 * args.weeks * WEEK
+    totals = {"fixed 15m": [0, []], "adaptive": [0, []]}
+    matches = 0
+    for _ in range(args.players):
+        finished = play_history(rng, 2 * args.weeks)
+        matches += sum(start <= ts < end for ts in finished)
+        for name, strategy in (("fixed 15m", fixed), ("adaptive", adaptive)):
+            calls, waits = strategy(finished, start, end)
+            totals[name][0] += calls
+            totals[name][1].extend(waits)
+
+    print(f"{args.players} players, {args.weeks} weeks measured, {matches} matches, {HOURS_PER_WEEK}h profile")
+    for name, (calls, waits) in totals.items():
+        report(name, calls, waits, args.weeks, args.players)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Local stand-in for the Leetify public API
+
+    python -m benchmarks.fake_leetify --players 20 --matches 200 --port 8089
+
+then start the bot with LEETIFY_URL=http://127.0.0.1:8089
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+from benchmarks.synthetic import generate_history, generate_profile, steam64
+
+class FakeLeetify:
+    """
+    Serves /v3/profile/matches (with optional page/limit) and /v3/profile
+    from in-memory synthetic data. `latency` adds a delay to every request
+    and `error_rate` answers that share of requests with a 503.
+    """
+
+    def __init__(self, players: list[str], matches_per_player: int, seed: int = 0,
+                 latency: float = 0.0, error_rate: float = 0.0):
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.history = {
+            steamid: generate_history(self.rng, steamid, matches_per_player)
+            for steamid in players
+        }
+        self.profiles = {steamid: generate_profile(self.rng, steamid) for steamid in players}
+        # Encoded pages, so JSON encoding on the shared loop does not skew poll timings
+        self._pages: dict[tuple, bytes] = {}
+
+    def add_matches(self, steamid: str, matches: list[dict]):
+        """Prepend newly finished matches, newest first."""
+        self.history[steamid][:0] = matches
+        self._pages = {key: body for key, body in self._pages.items() if key[0] != steamid}
+
+    async def _delay(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.error_rate and self.rng.random() < self.error_rate
+
+    async def matches(self, request: web.Request):
+        if await self._delay():
+            return web.Response(status=503)
+        steamid = request.query.get("steam64_id")
+        if steamid not in self.history:
+            return web.json_response({"error": "not found"}, status=404)
+        limit = int(request.query.get("limit", 100))
+        page = int(request.query.get("page", 0))
+        key = (steamid, page, limit)
+        if key not in self._pages:
+            self._pages[key] = json.dumps(self.history[steamid][page * limit:(page + 1) * limit]).encode()
+        return web.Response(body=self._pages[key], content_type="application/json")
+
+    async def profile(self, request: web.Request):
+        if await self._delay():
+            return web.Response(status=503)
+        steamid = request.query.get("steam64_id")
+        if steamid not in self.profiles:
+            return web.json_response({"error": "not found"}, status=404)
+        return web.json_response(self.profiles[steamid])
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v3/profile/matches", self.matches)
+        app.router.add_get("/v3/profile", self.profile)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> tuple[web.AppRunner, str]:
+        """Start serving in the current loop. Returns the runner and base URL."""
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        port = runner.addresses[0][1]
+        return runner, f"http://{host}:{port}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Leetify API")
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--matches", type=int, default=100, help="Matches per player")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each request")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    players = [steam64(i) for i in range(args.players)]
+    fake = FakeLeetify(players, args.matches, latency=args.latency, error_rate=args.error_rate)
+    print("players:", ",".join(players))
+    web.run_app(fake.app(), host="127.0.0.1", port=args.port)
+
+if __name__ == "__main__":
+    main()
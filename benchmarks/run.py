@@ -0,0 +1,131 @@
+"""
+End-to-end benchmark against the fake Leetify server, no network or Discord needed
+
+    python -m benchmarks.run --players 50 --matches 100 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fake_leetify import FakeLeetify
+from benchmarks.synthetic import generate_match, steam64
+from utils.client import LeetifyClient
+from utils.outbox import OutboxWorker
+from utils.database import init_db, close_db, add_tracked_player, get_tracked_players, insert_matches
+from utils.poller import poll_roster
+from utils.strings import load_strings
+from utils.records import parse_match
+
+class FakeChannel:
+    """Records what would have been posted to Discord."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+
+    async def send(self, *args, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(kwargs)
+
+def db_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+def mib(n: int) -> str:
+    return f"{n / 2**20:.2f} MiB"
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+async def run(args):
+    rng = random.Random(args.seed + 1)  # not the fake server's stream, or match ids collide
+    players = [steam64(i) for i in range(args.players)]
+    fake = FakeLeetify(players, args.matches, seed=args.seed, latency=args.latency)
+    runner, url = await fake.start()
+    channel = FakeChannel(args.send_delay)
+
+    async def get_channel(_channel_id):
+        return channel
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        await init_db(path)
+        for steamid in players:
+            await add_tracked_player(steamid)
+        roster = {steamid: [0] for steamid in await get_tracked_players()}
+        size_empty = db_size(path)
+
+        tracemalloc.start()
+        async with LeetifyClient("bench", base_url=url, rate=args.rate, burst=args.rate) as client:
+            outbox = OutboxWorker(get_channel, client)
+            elapsed = await timed(poll_roster(roster, client, args.concurrency))
+            rows = args.players * args.matches * 10
+            results.append(("poll, cold (all matches new)", elapsed, f"{rows / elapsed:,.0f} rows/s offered"))
+
+            elapsed = await timed(outbox.drain())
+            results.append(("outbox drain", elapsed, f"{len(channel.sent)} posts"))
+
+            elapsed = await timed(poll_roster(roster, client, args.concurrency))
+            results.append(("poll, idle (nothing new)", elapsed, ""))
+
+            now = datetime.now(timezone.utc)
+            for steamid in players:
+                fake.add_matches(steamid, [generate_match(rng, [steamid], now)])
+            posted = len(channel.sent)
+            elapsed = await timed(poll_roster(roster, client, args.concurrency))
+            results.append(("poll, one new match each", elapsed, ""))
+            elapsed = await timed(outbox.drain())
+            results.append(("outbox drain", elapsed, f"{len(channel.sent) - posted} posts"))
+
+        size_polled = db_size(path)
+
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        backlog = [
+            parse_match(generate_match(rng, [rng.choice(players)], start + timedelta(hours=i)))
+            for i in range(args.ingest)
+        ]
+        elapsed = 0.0
+        for i in range(0, len(backlog), 100):
+            elapsed += await timed(insert_matches(backlog[i:i + 100]))
+        results.append(("insert_matches, pages of 100", elapsed, f"{len(backlog) * 10 / elapsed:,.0f} rows/s"))
+
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        size_final = db_size(path)
+        await close_db()
+    await runner.cleanup()
+
+    print(f"{args.players} players x {args.matches} matches, {args.latency * 1000:.0f} ms fake latency, "
+          f"concurrency {args.concurrency}, {fake.requests} API requests")
+    for name, seconds, extra in results:
+        print(f"  {name:<32} {seconds:8.3f}s  {extra}")
+    print(f"  db size: empty {mib(size_empty)}, after polls {mib(size_polled)}, "
+          f"after ingest {mib(size_final)} (+{(size_final - size_polled) / max(args.ingest, 1) / 1024:.1f} KiB/match)")
+    print(f"  peak traced memory: {mib(peak)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="AntonSlayer end-to-end benchmark")
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--matches", type=int, default=50, help="Matches per player on the fake API")
+    parser.add_argument("--ingest", type=int, default=2000, help="Extra matches for the bulk insert run")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake API latency in seconds")
+    parser.add_argument("--send-delay", type=float, default=0.0, help="Fake Discord send latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=1000.0, help="Client requests per second")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    load_strings(os.path.join(os.path.dirname(__file__), "..", "strings.json"))
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Synthetic Leetify payloads with the same shape as /v3/profile/matches and /v3/profile
+"""
+
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from utils.database import COLUMNS
+
+MAPS = ["de_ancient", "de_anubis", "de_dust2", "de_inferno", "de_mirage", "de_nuke", "de_overpass", "de_train", "de_vertigo"]
+
+# Everything in a stats entry that is not filled from the match itself
+MATCH_LEVEL = {
+    "match_id", "finished_at", "data_source", "data_source_match_id", "map_name",
+    "has_banned_player", "team_score", "enemy_team_score", "win",
+}
+STAT_KEYS = [name for name in COLUMNS if name not in MATCH_LEVEL]
+
+def steam64(n: int) -> str:
+    return str(76561198000000000 + n)
+
+def player_stats(rng: random.Random, steamid: str, team: int, rounds: int, rounds_won: int) -> dict:
+    kills = max(0, int(rng.gauss(rounds * 0.7, 5)))
+    deaths = max(1, int(rng.gauss(rounds * 0.68, 4)))
+    hs = int(kills * rng.uniform(0.3, 0.6))
+    damage = int(kills * rng.uniform(85, 110) + rng.randint(0, 400))
+    shots = rng.randint(rounds * 8, rounds * 20)
+    hit = int(shots * rng.uniform(0.12, 0.25))
+    trade_opp = rng.randint(0, rounds // 2)
+    trade_att = rng.randint(0, trade_opp)
+    trade_ok = rng.randint(0, trade_att)
+    traded_opp = rng.randint(0, rounds // 2)
+    traded_att = rng.randint(0, traded_opp)
+    traded_ok = rng.randint(0, traded_att)
+    strafes = rng.randint(50, 400)
+    good = int(strafes * rng.uniform(0.5, 0.9))
+    survived = max(0, rounds - deaths)
+    multi = [rng.randint(0, kills // 2 + 1) for _ in range(3)] + [int(rng.random() < 0.15), int(rng.random() < 0.02)]
+    flashes = rng.randint(0, 25)
+
+    stats = {
+        "steam64_id": steamid,
+        "name": f"player_{steamid[-4:]}",
+        "initial_team_number": team,
+        "total_kills": kills,
+        "total_deaths": deaths,
+        "total_assists": rng.randint(0, 10),
+        "total_hs_kills": hs,
+        "kd_ratio": round(kills / deaths, 2),
+        "mvps": rng.randint(0, 6),
+        "score": kills * 2 + rng.randint(0, 20),
+        "total_damage": damage,
+        "dpr": round(damage / rounds, 2),
+        "rounds_count": rounds,
+        "rounds_survived": survived,
+        "rounds_survived_percentage": round(survived / rounds * 100, 2),
+        "rounds_won": rounds_won,
+        "rounds_lost": rounds - rounds_won,
+        "accuracy": round(hit / shots, 4),
+        "accuracy_enemy_spotted": round(rng.uniform(0.15, 0.45), 4),
+        "accuracy_head": round(rng.uniform(0.1, 0.35), 4),
+        "spray_accuracy": round(rng.uniform(0.1, 0.4), 4),
+        "preaim": round(rng.uniform(5, 20), 2),
+        "reaction_time": round(rng.uniform(0.45, 0.8), 3),
+        "shots_fired": shots,
+        "shots_fired_enemy_spotted": int(shots * 0.7),
+        "shots_hit_foe": hit,
+        "shots_hit_foe_head": int(hit * 0.2),
+        "shots_hit_friend": rng.randint(0, 5),
+        "shots_hit_friend_head": rng.randint(0, 1),
+        "utility_on_death_avg": round(rng.uniform(0, 300), 2),
+        "he_thrown": rng.randint(0, 15),
+        "he_foes_damage_avg": round(rng.uniform(0, 30), 2),
+        "he_friends_damage_avg": round(rng.uniform(0, 5), 2),
+        "molotov_thrown": rng.randint(0, 15),
+        "smoke_thrown": rng.randint(0, 20),
+        "flashbang_thrown": flashes,
+        "flashbang_hit_foe": rng.randint(0, flashes * 2),
+        "flashbang_hit_friend": rng.randint(0, flashes),
+        "flashbang_leading_to_kill": rng.randint(0, 3),
+        "flashbang_hit_foe_avg_duration": round(rng.uniform(0, 3), 2),
+        "flash_assist": rng.randint(0, 3),
+        "counter_strafing_shots_all": strafes,
+        "counter_strafing_shots_good": good,
+        "counter_strafing_shots_bad": strafes - good,
+        "counter_strafing_shots_good_ratio": round(good / strafes, 4),
+        "trade_kill_opportunities": trade_opp,
+        "trade_kill_attempts": trade_att,
+        "trade_kills_succeed": trade_ok,
+        "trade_kill_attempts_percentage": round(trade_att / trade_opp, 4) if trade_opp else 0,
+        "trade_kills_success_percentage": round(trade_ok / trade_att, 4) if trade_att else 0,
+        "trade_kill_opportunities_per_round": round(trade_opp / rounds, 4),
+        "traded_death_opportunities": traded_opp,
+        "traded_death_attempts": traded_att,
+        "traded_deaths_succeed": traded_ok,
+        "traded_death_attempts_percentage": round(traded_att / traded_opp, 4) if traded_opp else 0,
+        "traded_deaths_success_percentage": round(traded_ok / traded_att, 4) if traded_att else 0,
+        "traded_deaths_opportunities_per_round": round(traded_opp / rounds, 4),
+        "multi1k": multi[0],
+        "multi2k": multi[1],
+        "multi3k": multi[2],
+        "multi4k": multi[3],
+        "multi5k": multi[4],
+        "leetify_rating": round(rng.gauss(0, 0.04), 4),
+        "ct_leetify_rating": round(rng.gauss(0, 0.05), 4),
+        "t_leetify_rating": round(rng.gauss(0, 0.05), 4),
+    }
+    # Any stat added to FIELDS later still gets a value
+    for key in STAT_KEYS:
+        stats.setdefault(key, rng.randint(0, 10))
+    return stats
+
+def generate_match(rng: random.Random, players: list[str], finished_at: datetime) -> dict:
+    """One match of ten players. `players` are put in the lobby, the rest are randoms."""
+    lobby = list(players[:10])
+    while len(lobby) < 10:
+        lobby.append(steam64(rng.randint(10**6, 10**9)))
+    rng.shuffle(lobby)
+
+    winner = rng.choice([2, 3])
+    if rng.random() < 0.05:
+        scores = {2: 12, 3: 12}
+    else:
+        scores = {winner: 13, 5 - winner: rng.randint(0, 11)}
+    rounds = scores[2] + scores[3]
+
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "finished_at": finished_at.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+        "data_source": rng.choice(["matchmaking", "matchmaking_competitive", "faceit"]),
+        "data_source_match_id": str(rng.getrandbits(60)),
+        "map_name": rng.choice(MAPS),
+        "has_banned_player": rng.random() < 0.01,
+        "replay_url": None,
+        "team_scores": [{"team_number": 2, "score": scores[2]}, {"team_number": 3, "score": scores[3]}],
+        "stats": [
+            player_stats(rng, steamid, 2 + i % 2, rounds, scores[2 + i % 2])
+            for i, steamid in enumerate(lobby)
+        ],
+    }
+
+def generate_history(rng: random.Random, steamid: str, count: int, end: datetime | None = None, friends: list[str] = ()) -> list[dict]:
+    """`count` matches for one player, newest first like the API returns them."""
+    end = end or datetime.now(timezone.utc)
+    matches = []
+    finished_at = end
+    for _ in range(count):
+        finished_at -= timedelta(minutes=rng.randint(40, 60 * 24))
+        matches.append(generate_match(rng, [steamid, *friends], finished_at))
+    return matches
+
+def generate_profile(rng: random.Random, steamid: str) -> dict:
+    return {
+        "steam64_id": steamid,
+        "name": f"player_{steamid[-4:]}",
+        "winrate": round(rng.uniform(0.35, 0.65), 3),
+        "total_matches": rng.randint(100, 3000),
+        "ranks": {
+            "leetify": round(rng.uniform(-3, 3), 2),
+            "premier": rng.randint(5000, 25000),
+            "faceit": rng.randint(1, 10),
+            "faceit_elo": rng.randint(500, 3000),
+        },
+    }
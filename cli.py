@@ -0,0 +1,146 @@
+"""
+Offline commands for the bot's database
+
+    python cli.py backfill [--players ID ...] [--concurrency N] [--restart]
+    python cli.py trends [--player ID]
+    python cli.py reindex [--chunk N]
+    python cli.py maintain [--retention-days N] [--vacuum]
+    python cli.py export [--format csv|ndjson] [--player ID] [--map NAME] [--since DATE] [--until DATE] [--part-size MB] [--out STEM]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from utils.backfill import run_backfill
+from utils.client import LeetifyClient
+from utils.metrics import setup_logging
+from utils.database import (
+    DB_FILE, init_db, close_db, get_tracked_players, rebuild_trends, get_archive_stats, reindex_matches, vacuum_full
+)
+from utils.export import FORMATS, iter_export, part_filename
+from utils.maintenance import DEFAULT_RETENTION_DAYS, format_report, run_maintenance
+
+async def backfill(args):
+    steamids = args.players or await get_tracked_players()
+    if not steamids:
+        print("No players to backfill, add some with --players or track them first")
+        return
+    async with LeetifyClient(os.getenv("LEETIFY_TOKEN"), rate=float(os.getenv("LEETIFY_RATE") or 2.0)) as client:
+        await run_backfill(client, steamids, args.concurrency, args.restart)
+
+async def trends(args):
+    count = await rebuild_trends(args.player)
+    print(f"Rebuilt trend state for {count} player(s)")
+
+async def reindex(args):
+    archived, size, compressed, missing = await get_archive_stats()
+    print(f"Archive: {archived} matches, {size / 2**20:.1f} MiB of JSON in {compressed / 2**20:.1f} MiB")
+    if missing:
+        print(f"{missing} stored matches have no archived payload and are left as they are")
+    if not archived:
+        return
+
+    start = time.perf_counter()
+
+    def progress(matches: int, rows: int):
+        elapsed = time.perf_counter() - start
+        print(f"\r{matches}/{archived} matches, {rows} rows, {matches / elapsed:.0f} matches/s", end="", file=sys.stderr)
+
+    matches, rows = await reindex_matches(args.chunk, progress)
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+    print(
+        f"Reindexed {matches} matches ({rows} rows) in {elapsed:.1f}s: {matches / elapsed:.0f} matches/s, "
+        f"{size / 2**20 / elapsed:.1f} MiB/s of JSON"
+    )
+
+async def maintain(args):
+    if args.vacuum:
+        start = time.perf_counter()
+        await vacuum_full()
+        print(f"Full VACUUM in {time.perf_counter() - start:.1f}s, the database now shrinks incrementally")
+    result = await run_maintenance(args.retention_days)
+    for line in format_report(result):
+        print(line)
+
+def date(value: str) -> int:
+    """YYYY-MM-DD as a UTC timestamp."""
+    return int(datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+async def export(args):
+    part_size = int(args.part_size * 2**20) if args.part_size else None
+    paths, out = [], None
+    async for part, data in iter_export(
+        args.format, part_size, steam64_id=args.player, map_name=args.map, since=args.since, until=args.until
+    ):
+        if part > len(paths):
+            if out is not None:
+                out.close()
+            paths.append(part_filename(args.format, part, single=False, stem=args.out))
+            out = open(paths[-1], "wb")
+        out.write(data)
+    out.close()
+
+    if len(paths) == 1:
+        os.replace(paths[0], part_filename(args.format, 1, single=True, stem=args.out))
+        paths = [part_filename(args.format, 1, single=True, stem=args.out)]
+    for path in paths:
+        print(f"{path}  {os.path.getsize(path) / 2**20:.1f} MiB")
+
+async def run(args):
+    await init_db(args.db)
+    try:
+        await args.func(args)
+    finally:
+        await close_db()
+
+def main():
+    load_dotenv()
+    setup_logging(os.getenv("LOG_LEVEL") or "INFO")
+
+    parser = argparse.ArgumentParser(description="AntonSlayer database tools")
+    parser.add_argument("--db", default=DB_FILE, help="Database file")
+    commands = parser.add_subparsers(required=True)
+
+    parser_backfill = commands.add_parser("backfill", help="Import full match history from Leetify")
+    parser_backfill.add_argument("--players", nargs="*", help="Steam64 IDs, defaults to the tracked roster")
+    parser_backfill.add_argument("--concurrency", type=int, default=4)
+    parser_backfill.add_argument("--restart", action="store_true", help="Ignore saved checkpoints")
+    parser_backfill.set_defaults(func=backfill)
+
+    parser_trends = commands.add_parser("trends", help="Rebuild streak and trend state from match_history")
+    parser_trends.add_argument("--player", help="Steam64 ID, defaults to the tracked roster")
+    parser_trends.set_defaults(func=trends)
+
+    parser_reindex = commands.add_parser("reindex", help="Rebuild match_history from the raw payload archive")
+    parser_reindex.add_argument("--chunk", type=int, default=2000, help="Matches per transaction")
+    parser_reindex.set_defaults(func=reindex)
+
+    parser_maintain = commands.add_parser("maintain", help="Retention, vacuum, statistics and query plan checks")
+    parser_maintain.add_argument(
+        "--retention-days", type=int, default=int(os.getenv("MATCH_RETENTION_DAYS") or DEFAULT_RETENTION_DAYS),
+        help="Keep lobby rows of players nobody tracks this long, 0 keeps everything"
+    )
+    parser_maintain.add_argument("--vacuum", action="store_true", help="Full VACUUM first, needed once on older databases")
+    parser_maintain.set_defaults(func=maintain)
+
+    parser_export = commands.add_parser("export", help="Write match_history as gzip compressed CSV or NDJSON")
+    parser_export.add_argument("--format", choices=FORMATS, default="csv")
+    parser_export.add_argument("--player", help="Only this Steam64 ID")
+    parser_export.add_argument("--map", help="Only this map")
+    parser_export.add_argument("--since", type=date, help="YYYY-MM-DD, inclusive")
+    parser_export.add_argument("--until", type=date, help="YYYY-MM-DD, exclusive")
+    parser_export.add_argument("--part-size", type=float, help="Split into files of at most this many MiB")
+    parser_export.add_argument("--out", default="match_history", help="Output file name without extension")
+    parser_export.set_defaults(func=export)
+
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Commands to set up the bot per server"""
+
+import discord
+from discord import app_commands
+from discord.app_commands import Choice
+from discord.ext import commands
+
+from utils.alerts import OPERATORS, STATS
+from utils.database import (
+    set_guild_setting, add_guild_player, remove_guild_player, get_player_name, add_alert_rule, remove_alert_rule
+)
+from utils.guilds import get_config
+
+def is_steam64(value: str) -> bool:
+    return value.isdigit() and len(value) == 17
+
+class Config(commands.Cog):
+    config = app_commands.Group(
+        name="config",
+        description="Server settings for match posts",
+        guild_only=True,
+        default_permissions=discord.Permissions(manage_guild=True),
+    )
+    alert = app_commands.Group(name="alert", description="Call-outs added to match posts", parent=config)
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @config.command(name="show", description="Show this server's settings")
+    async def show(self, interaction: discord.Interaction):
+        config = await get_config(interaction.guild_id)
+        if config is None:
+            await interaction.response.send_message(content="Nothing configured yet.", ephemeral=True)
+            return
+
+        players = []
+        for steamid in config.players:
+            name = await get_player_name(steamid)
+            players.append(f"{name} ({steamid})" if name else steamid)
+
+        embed = discord.Embed(title="⚙️ Server settings", color=discord.Color.dark_grey())
+        embed.add_field(name="Channel", value=f"<#{config.channel_id}>" if config.channel_id else "not set", inline=True)
+        embed.add_field(name="Players", value="\n".join(players) or "none", inline=False)
+        rules = [
+            f"`#{rule.id}` {rule.describe()}" + (f" ({rule.steam64_id})" if rule.steam64_id else "")
+            for rule in config.rules
+        ]
+        embed.add_field(name="Alerts", value="\n".join(rules) or "none", inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @config.command(name="channel", description="Channel to post matches in")
+    async def channel(self, interaction: discord.Interaction, channel: discord.TextChannel):
+        await set_guild_setting(interaction.guild_id, "channel_id", channel.id)
+        await interaction.response.send_message(content=f"Posting matches in {channel.mention}.", ephemeral=True)
+
+    @alert.command(name="add", description="Call out matches where a stat crosses a threshold")
+    @app_commands.describe(
+        stat="Stat to check, ratings as shown on Leetify",
+        op="Comparison",
+        value="Threshold",
+        streak="Only when it happens this many matches in a row",
+        player="Only for this Steam64 ID, defaults to every player",
+    )
+    @app_commands.choices(
+        stat=[Choice(name=name, value=name) for name in STATS],
+        op=[Choice(name=op, value=op) for op in OPERATORS],
+    )
+    async def alert_add(self, interaction: discord.Interaction, stat: Choice[str], op: Choice[str], value: float,
+                        streak: app_commands.Range[int, 1, 20] = 1, player: str | None = None):
+        if player is not None and not is_steam64(player):
+            await interaction.response.send_message(content="That is not a Steam64 ID.", ephemeral=True)
+            return
+        rule_id = await add_alert_rule(interaction.guild_id, player, STATS[stat.value][0], op.value, value, streak)
+        config = await get_config(interaction.guild_id)
+        rule = next(rule for rule in config.rules if rule.id == rule_id)
+        await interaction.response.send_message(content=f"Added alert `#{rule_id}`: {rule.describe()}.", ephemeral=True)
+
+    @alert.command(name="remove", description="Remove an alert")
+    @app_commands.describe(rule="Alert to remove")
+    async def alert_remove(self, interaction: discord.Interaction, rule: int):
+        removed = await remove_alert_rule(interaction.guild_id, rule)
+        text = f"Removed alert `#{rule}`." if removed else f"There is no alert `#{rule}` here."
+        await interaction.response.send_message(content=text, ephemeral=True)
+
+    @alert_remove.autocomplete("rule")
+    async def alert_remove_rule(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[int]]:
+        config = await get_config(interaction.guild_id)
+        rules = config.rules if config else []
+        return [
+            app_commands.Choice(name=f"#{rule.id} {rule.describe()}"[:100], value=rule.id)
+            for rule in rules if current.lower() in f"#{rule.id} {rule.describe()}".lower()
+        ][:25]
+
+    @config.command(name="track", description="Post this player's matches here")
+    @app_commands.describe(player="Steam64 ID")
+    async def track(self, interaction: discord.Interaction, player: str):
+        if not is_steam64(player):
+            await interaction.response.send_message(content="That is not a Steam64 ID.", ephemeral=True)
+            return
+        added = await add_guild_player(interaction.guild_id, player)
+        text = f"Tracking {player}." if added else f"{player} is already tracked here."
+        await interaction.response.send_message(content=text, ephemeral=True)
+
+    @config.command(name="untrack", description="Stop posting this player's matches here")
+    @app_commands.describe(player="Steam64 ID")
+    async def untrack(self, interaction: discord.Interaction, player: str):
+        removed = await remove_guild_player(interaction.guild_id, player)
+        text = f"Stopped tracking {player}." if removed else f"{player} is not tracked here."
+        await interaction.response.send_message(content=text, ephemeral=True)
+
+    @untrack.autocomplete("player")
+    async def untrack_player(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        config = await get_config(interaction.guild_id)
+        players = config.players if config else []
+        return [app_commands.Choice(name=steamid, value=steamid) for steamid in players if current in steamid][:25]
+
+# Required setup function for cogs
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Config(bot))
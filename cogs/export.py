@@ -0,0 +1,71 @@
+"""Command to download match history"""
+
+import logging
+import tempfile
+import time
+
+import discord
+from discord import app_commands
+from discord.app_commands import Choice
+from discord.ext import commands
+
+from utils.export import FORMATS, iter_export, part_filename
+
+log = logging.getLogger(__name__)
+
+# Upload limit outside a guild
+DEFAULT_UPLOAD_LIMIT = 10 * 2**20
+
+class Export(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @app_commands.command(name="export", description="Download stored matches as a gzip file")
+    @app_commands.describe(
+        format="File format",
+        player="Only this Steam64 ID, one this server tracks",
+        map="Only this map, e.g. de_mirage",
+        days="Only the last N days",
+    )
+    @app_commands.choices(format=[Choice(name=fmt.upper(), value=fmt) for fmt in FORMATS])
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.guild_only()
+    async def export(
+        self,
+        interaction: discord.Interaction,
+        format: Choice[str],
+        player: str | None = None,
+        map: str | None = None,
+        days: app_commands.Range[int, 1, 3650] | None = None,
+    ):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        limit = interaction.guild.filesize_limit if interaction.guild else DEFAULT_UPLOAD_LIMIT
+        since = int(time.time()) - days * 86400 if days else None
+
+        async def upload(spool, part: int, single: bool):
+            spool.seek(0)
+            await interaction.followup.send(
+                file=discord.File(spool, filename=part_filename(format.value, part, single)), ephemeral=True
+            )
+            spool.close()
+
+        # Each part is spooled to disk and sent once the next one starts
+        spool, current = tempfile.TemporaryFile(), 1
+        try:
+            # Only the players this guild follows
+            async for part, data in iter_export(
+                format.value, limit, steam64_id=player, map_name=map, since=since, guild_id=interaction.guild_id
+            ):
+                if part != current:
+                    await upload(spool, current, single=False)
+                    spool, current = tempfile.TemporaryFile(), part
+                spool.write(data)
+            await upload(spool, current, single=current == 1)
+        except Exception as e:
+            spool.close()
+            log.exception("export failed", extra={"error": repr(e)})
+            await interaction.followup.send(content="Export failed.", ephemeral=True)
+
+# Required setup function for cogs
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Export(bot))
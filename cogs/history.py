@@ -1,23 +1,244 @@
 """Command to see various stats history"""
 
+import asyncio
+import io
+import logging
+from datetime import datetime, timedelta, timezone
+
 import discord
 from discord import app_commands
 from discord.app_commands import Choice
 from discord.ext import commands
 
+from utils.charts import ChartRenderer
+from utils.database import (
+    MatchPage, MatchSummary, get_matches, get_rollup, get_player_name, get_tracked_players,
+    get_newest_match_id, get_trend,
+)
+from utils.guilds import get_config
+from utils.leetify import format_rating
+
+log = logging.getLogger(__name__)
+
+def ratio(a, b) -> float:
+    return a / b if b else float(a)
+
+def history_table(category: str, weeks: list[tuple]) -> str:
+    """One line per week, oldest first, read straight from the weekly rollup."""
+    lines = []
+    for week, matches, wins, kills, deaths, rounds, rating in reversed(weeks):
+        if category == "Matches":
+            lines.append(f"{week}  {matches:>3} played  {wins:>3}W {matches - wins:>3}L  {ratio(wins, matches) * 100:5.1f}%")
+        elif category == "Kills":
+            lines.append(f"{week}  {kills:>4} kills  {ratio(kills, matches):5.1f}/match  K/D {ratio(kills, deaths):.2f}")
+        else:
+            rating_text = f"{rating * 100:+6.2f}" if rating is not None else "   n/a"
+            lines.append(f"{week}  rating {rating_text}  over {matches} matches")
+    return "\n".join(lines)
+
+def history_series(category: str, weeks: list[tuple]) -> tuple[list[str], list[float], str]:
+    """Chart points, oldest first: winrate for Matches, kills per match, or rating."""
+    labels, values = [], []
+    for week, matches, wins, kills, deaths, rounds, rating in reversed(weeks):
+        labels.append(week)
+        if category == "Matches":
+            values.append(ratio(wins, matches) * 100)
+        elif category == "Kills":
+            values.append(ratio(kills, matches))
+        else:
+            values.append(rating * 100 if rating is not None else float("nan"))
+    ylabel = {"Matches": "Winrate %", "Kills": "Kills per match"}.get(category, "Leetify rating")
+    return labels, values, ylabel
+
+def first_week(weeks: int) -> str:
+    """Monday (UTC, like the weekly rollup keys) of the oldest of the last `weeks` calendar weeks."""
+    today = datetime.now(timezone.utc).date()
+    return (today - timedelta(days=today.weekday(), weeks=weeks - 1)).isoformat()
+
+PAGE_SIZE = 10
+
+def match_line(match: MatchSummary) -> str:
+    day = datetime.fromtimestamp(match.finished_at, tz=timezone.utc).strftime("%m-%d")
+    score, enemy = match.team_score, match.enemy_team_score
+    result = "?" if score is None or enemy is None else "W" if score > enemy else "L" if score < enemy else "T"
+    rating = f"{match.leetify_rating * 100:+6.2f}" if match.leetify_rating is not None else "   n/a"
+    return (
+        f"{day} {match.map_name.removeprefix('de_')[:8]:<8} {score}:{enemy} {result}"
+        f" {match.total_kills}/{match.total_deaths} {rating}"
+    )
+
+class MatchPager(discord.ui.View):
+    """
+    Prev / next through a player's matches, one embed field at a time.
+    Pages come from keyset cursors, so page 50 costs what page 1 does, and
+    the next page is fetched while the current one is on screen.
+    """
+
+    def __init__(self, owner_id: int, player: str, field_index: int, timeout: float = 300):
+        super().__init__(timeout=timeout)
+        self.owner_id = owner_id
+        self.player = player
+        self.field_index = field_index
+        self.pages: list[MatchPage] = []
+        self.position = 0
+        self.message: discord.Message | None = None
+        self._prefetch: asyncio.Task | None = None
+
+    async def start(self) -> str:
+        self.pages.append(await get_matches(self.player, limit=PAGE_SIZE))
+        self._after_move()
+        return self.render()
+
+    def render(self) -> str:
+        page = self.pages[self.position]
+        lines = "\n".join(match_line(match) for match in page.matches) or "No matches"
+        return f"```\n{lines}\n```Page {self.position + 1}"
+
+    def _after_move(self):
+        page = self.pages[self.position]
+        self.previous_page.disabled = self.position == 0
+        self.next_page.disabled = page.next_cursor is None
+        if page.next_cursor is not None and self.position + 1 == len(self.pages) and self._prefetch is None:
+            self._prefetch = asyncio.create_task(get_matches(self.player, limit=PAGE_SIZE, after=page.next_cursor))
+
+    async def _show(self, interaction: discord.Interaction):
+        self._after_move()
+        embed = interaction.message.embeds[0]
+        embed.set_field_at(self.field_index, name="Matches", value=self.render(), inline=False)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id == self.owner_id:
+            return True
+        await interaction.response.send_message(
+            content="This pager belongs to whoever ran /history, run it yourself to page through.", ephemeral=True
+        )
+        return False
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.position = max(self.position - 1, 0)
+        await self._show(interaction)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.position + 1 == len(self.pages):
+            if self._prefetch is None:
+                return
+            task, self._prefetch = self._prefetch, None
+            try:
+                page = await task
+            except Exception as e:
+                log.warning("match page prefetch failed", extra={"error": repr(e)})
+                page = await get_matches(self.player, limit=PAGE_SIZE, after=self.pages[-1].next_cursor)
+            self.pages.append(page)
+        self.position += 1
+        await self._show(interaction)
+
+    async def on_timeout(self):
+        if self._prefetch is not None:
+            self._prefetch.cancel()
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
 class History(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.charts = ChartRenderer()
+
+    async def cog_unload(self):
+        self.charts.close()
 
     @app_commands.command(name="history", description="Get various Anton history")
-    @app_commands.describe(category="Category")
+    @app_commands.describe(
+        category="Category",
+        player="Steam64 ID, defaults to the first player tracked here",
+        weeks="How many weeks back to show",
+    )
     @app_commands.choices(category=[
         Choice(name='Matches', value="1"),
         Choice(name='Kills', value="2"),
         Choice(name='Rating', value="3"),
     ])
-    async def history(self, interaction: discord.Interaction, category: Choice[str]):
-        await interaction.response.send_message(content="PONG")
+    async def history(
+        self,
+        interaction: discord.Interaction,
+        category: Choice[str],
+        player: str | None = None,
+        weeks: app_commands.Range[int, 1, 52] = 8,
+    ):
+        # Acknowledge before any database work, a busy writer queue or a cold
+        # chart cache would otherwise miss Discord's 3 second deadline
+        await interaction.response.defer()
+
+        if player is None:
+            config = await get_config(interaction.guild_id) if interaction.guild_id else None
+            roster = config.players if config and config.players else await get_tracked_players()
+            if not roster:
+                await interaction.followup.send(content="No tracked players.")
+                return
+            player = roster[0]
+
+        since = first_week(weeks)
+        weekly = await get_rollup("player_weekly_stats", player, weeks, since=since)
+        if not weekly:
+            await interaction.followup.send(content=f"No matches stored for `{player}` in the last {weeks} weeks.")
+            return
+
+        name = await get_player_name(player) or player
+        title = f"{name} - {category.name}, last {weeks} weeks"
+        embed = discord.Embed(
+            title=f"📈 {title}",
+            description=f"```\n{history_table(category.name, weekly)}\n```",
+            color=discord.Color.blurple(),
+        )
+
+        trend = await get_trend(player)
+        if trend is not None:
+            embed.add_field(
+                name="Form",
+                value=(
+                    f"Streak `{trend.streak_text()}` · EWMA `{format_rating(trend.ewma_rating)}` · "
+                    f"last 10 `{format_rating(trend.rolling_average(10))}` · "
+                    f"last 50 `{format_rating(trend.rolling_average(50))}`"
+                ),
+                inline=False,
+            )
+
+        maps = await get_rollup("player_map_stats", player, 5)
+        embed.add_field(
+            name="Most played maps",
+            value="\n".join(
+                f"`{map_name}` {matches} played, {ratio(wins, matches) * 100:.0f}% wins, K/D {ratio(kills, deaths):.2f}"
+                for map_name, matches, wins, kills, deaths, _, _ in maps
+            ),
+            inline=False,
+        )
+
+        pager = None
+        if category.name == "Matches":
+            pager = MatchPager(interaction.user.id, player, len(embed.fields))
+            embed.add_field(name="Matches", value=await pager.start(), inline=False)
+
+        # Keyed on the newest stored match, so the cache turns over exactly when a new match lands
+        key = (player, category.name, since, await get_newest_match_id(player))
+        labels, values, ylabel = history_series(category.name, weekly)
+        try:
+            png = await self.charts.render(key, title, labels, values, ylabel)
+        except Exception as e:
+            log.warning("chart render failed", extra={"error": repr(e)})
+            png = None
+
+        kwargs = {"view": pager} if pager else {}
+        if png is not None:
+            embed.set_image(url="attachment://history.png")
+            kwargs["file"] = discord.File(io.BytesIO(png), filename="history.png")
+        message = await interaction.followup.send(embed=embed, wait=True, **kwargs)
+        if pager:
+            pager.message = message
 
 # Required setup function for cogs
 async def setup(bot: commands.Bot):
@@ -0,0 +1,131 @@
+"""Commands to rank and compare players"""
+
+import discord
+from discord import app_commands
+from discord.app_commands import Choice
+from discord.ext import commands
+
+from utils.cache import GenerationCache
+from utils.database import (
+    get_config_generation, get_generation, get_leaderboard, get_player_summary, get_head_to_head,
+)
+
+METRICS = {
+    "rating": ("Leetify rating", "{:+.2f}"),
+    "kd": ("K/D", "{:.2f}"),
+    "adr": ("ADR", "{:.1f}"),
+    "trade": ("Trade success %", "{:.1f}"),
+    "utility": ("Utility damage", "{:.1f}"),
+}
+
+def fmt(metric: str, value) -> str:
+    return METRICS[metric][1].format(value) if value is not None else "n/a"
+
+class Leaderboard(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        # Only recomputed after an insert, repeated calls between polls skip SQLite
+        self.cache = GenerationCache(get_generation)
+
+    @app_commands.command(name="leaderboard", description="Rank players by a stat over their recent matches")
+    @app_commands.describe(
+        metric="Stat to rank by",
+        scope="Tracked players only, or everyone we have played with",
+        last="How many recent matches per player",
+    )
+    @app_commands.choices(
+        metric=[Choice(name=label, value=key) for key, (label, _) in METRICS.items()],
+        scope=[Choice(name="Tracked players", value="tracked"), Choice(name="Everyone", value="all")],
+    )
+    async def leaderboard(
+        self,
+        interaction: discord.Interaction,
+        metric: Choice[str],
+        scope: Choice[str] | None = None,
+        last: app_commands.Range[int, 1, 200] = 20,
+    ):
+        scope_value = scope.value if scope else "tracked"
+        guild_id = interaction.guild_id
+        if scope_value == "tracked" and guild_id is None:
+            await interaction.response.send_message(
+                content="Tracked players are per server, use this in a server or pick Everyone.", ephemeral=True
+            )
+            return
+        # Acknowledge before the query, a cold cache can take longer than
+        # Discord's 3 second deadline
+        await interaction.response.defer()
+
+        # Randoms show up once, so "everyone" needs a few shared matches to count
+        min_matches = 1 if scope_value == "tracked" else 5
+        # A tracked board is the guild's own roster, so it also changes with /config track
+        key = ("leaderboard", metric.value, scope_value, last)
+        if scope_value == "tracked":
+            key += (guild_id, get_config_generation())
+        rows = await self.cache.get(
+            key, lambda: get_leaderboard(metric.value, scope_value, last, min_matches, guild_id=guild_id),
+        )
+        if not rows:
+            await interaction.followup.send(content="Not enough matches stored yet.")
+            return
+
+        lines = [
+            f"{row['rank']:>2}. {(row['name'] or row['steam64_id'])[:18]:<18} "
+            f"{fmt(metric.value, row[metric.value]):>7}  ({row['matches']} matches)"
+            for row in rows
+        ]
+        embed = discord.Embed(
+            title=f"🏅 {metric.name} - last {last} matches",
+            description="```\n" + "\n".join(lines) + "\n```",
+            color=discord.Color.gold(),
+        )
+        await interaction.followup.send(embed=embed)
+
+    @app_commands.command(name="compare", description="Compare two players side by side")
+    @app_commands.describe(
+        player_a="Steam64 ID",
+        player_b="Steam64 ID",
+        last="How many recent matches per player",
+    )
+    async def compare(
+        self,
+        interaction: discord.Interaction,
+        player_a: str,
+        player_b: str,
+        last: app_commands.Range[int, 1, 200] = 20,
+    ):
+        await interaction.response.defer()
+
+        a = await self.cache.get(("summary", player_a, last), lambda: get_player_summary(player_a, last))
+        b = await self.cache.get(("summary", player_b, last), lambda: get_player_summary(player_b, last))
+        if a is None or b is None:
+            missing = player_a if a is None else player_b
+            await interaction.followup.send(content=f"No matches stored for `{missing}`.")
+            return
+        h2h = await self.cache.get(("h2h", player_a, player_b), lambda: get_head_to_head(player_a, player_b))
+
+        name_a = (a["name"] or player_a)[:14]
+        name_b = (b["name"] or player_b)[:14]
+        lines = [f"{'':<16}{name_a:>14}  {name_b:>14}"]
+        for key, (label, _) in METRICS.items():
+            lines.append(f"{label:<16}{fmt(key, a[key]):>14}  {fmt(key, b[key]):>14}")
+
+        embed = discord.Embed(
+            title=f"⚖️ {name_a} vs {name_b} - last {last} matches",
+            description="```\n" + "\n".join(lines) + "\n```",
+            color=discord.Color.blurple(),
+        )
+        if h2h["shared"]:
+            embed.add_field(
+                name="Shared matches",
+                value=(
+                    f"{h2h['shared']} together in a lobby\n"
+                    f"Same team: {h2h['together']} ({h2h['together_wins']} won)\n"
+                    f"Opposing: {name_a} {h2h['a_wins']} - {h2h['b_wins']} {name_b}"
+                ),
+                inline=False,
+            )
+        await interaction.followup.send(embed=embed)
+
+# Required setup function for cogs
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Leaderboard(bot))
@@ -0,0 +1,55 @@
+"""Admin command to see bot metrics"""
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from utils import metrics
+
+def latency_line(name: str, histogram: metrics.Histogram) -> str:
+    lines = []
+    for labels, child in sorted(histogram._children.items()):
+        if not child.count:
+            continue
+        label = " ".join(str(v) for _, v in labels)
+        lines.append(
+            f"{name} {label}".strip()
+            + f": n={child.count} avg={child.sum / child.count * 1000:.0f}ms"
+            + f" p50<={child.quantile(0.5) * 1000:.0f}ms p95<={child.quantile(0.95) * 1000:.0f}ms"
+        )
+    return "\n".join(lines) or f"{name}: no samples"
+
+class Stats(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @app_commands.command(name="stats", description="Bot timings and counters")
+    @app_commands.default_permissions(administrator=True)
+    async def stats(self, interaction: discord.Interaction):
+        timings = "\n".join([
+            latency_line("leetify", metrics.API_SECONDS),
+            latency_line("poll/player", metrics.POLL_SECONDS),
+            latency_line("poll/tick", metrics.TICK_SECONDS),
+            latency_line("insert", metrics.INSERT_SECONDS),
+            latency_line("send", metrics.SEND_SECONDS),
+        ])
+        counters = "\n".join([
+            f"API errors: {metrics.API_ERRORS.total():.0f} (429s: {metrics.API_THROTTLED.total():.0f})",
+            f"Rows inserted: {metrics.ROWS_INSERTED.total():.0f}, skipped: {metrics.ROWS_SKIPPED.total():.0f}",
+            f"Posts sent: {metrics.POSTS_SENT.total():.0f}",
+        ])
+        db_size = metrics.REGISTRY.metrics.get("db_size_bytes")
+        gauges = "\n".join([
+            f"DB size: {db_size.get() / 2**20:.1f} MiB" if db_size else "DB size: n/a",
+            f"Loop lag: {metrics.LOOP_LAG.get() * 1000:.1f}ms",
+        ])
+
+        embed = discord.Embed(title="🛠️ Bot stats", color=discord.Color.dark_grey())
+        embed.add_field(name="Timings", value=f"```\n{timings}\n```", inline=False)
+        embed.add_field(name="Counters", value=f"```\n{counters}\n```", inline=False)
+        embed.add_field(name="Gauges", value=f"```\n{gauges}\n```", inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# Required setup function for cogs
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Stats(bot))
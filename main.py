@@ -3,75 +3,212 @@ Anton bot bot
 """
 
 import os
+import json
+import time
+import hashlib
+import logging
 # from typing import Optional
 # import random
-# import logging
 
 import discord
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
 
-from utils.database import init_db
-from utils.leetify import fetch_latest_matches, process_matches
+from utils.client import LeetifyClient, URL
+from utils.metrics import setup_logging, start_metrics_server, monitor_loop_lag, STARTUP_SECONDS
+from utils.database import init_db, close_db, add_tracked_player, get_tracked_players, claim_legacy_cursor, get_state, set_state, seed_guild_config
+from utils.guilds import get_channels_by_player
+from utils.outbox import OutboxWorker
+from utils.poller import poll_roster, DEFAULT_CONCURRENCY
+from utils.schedule import PollScheduler, is_quiet
+from utils.maintenance import DEFAULT_RETENTION_DAYS, run_maintenance
+from utils.analytics import ENGINE
 from utils.strings import load_strings
+from utils.assets import load_assets
 
 # Init
+PROCESS_START = time.perf_counter()
 load_dotenv()
+setup_logging(os.getenv("LOG_LEVEL") or "INFO")
 load_strings()
+load_assets()
+log = logging.getLogger("bot")
 
 # ====== ENV ======
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 LEETIFY_TOKEN = os.getenv("LEETIFY_TOKEN")
+# Point at benchmarks/fake_leetify.py for offline runs
+LEETIFY_URL = os.getenv("LEETIFY_URL") or URL
 
+# First-run config for one guild, after that use /config in each guild
 GUILD_ID = os.getenv("GUILD_ID") or None
-TARGET_CHANNEL_ID = int(os.getenv("TARGET_CHANNEL_ID"))
+TARGET_CHANNEL_ID = int(os.getenv("TARGET_CHANNEL_ID") or 0) or None
 
 TARGET_STEAM64 = os.getenv("TARGET_STEAM64") # Anton Steam64
-KILLS_MAX = int(os.getenv("KILLS_MAX"))
+# Extra players to track, comma separated Steam64 IDs
+TRACKED_PLAYERS = [s.strip() for s in os.getenv("TRACKED_PLAYERS", "").split(",") if s.strip()]
+POLL_CONCURRENCY = int(os.getenv("POLL_CONCURRENCY") or DEFAULT_CONCURRENCY)
+# Leetify requests per second and burst size
+LEETIFY_RATE = float(os.getenv("LEETIFY_RATE") or 2.0)
+LEETIFY_BURST = int(os.getenv("LEETIFY_BURST") or 5)
+# Seconds a Leetify profile stays cached
+PROFILE_TTL = float(os.getenv("PROFILE_TTL") or 600)
+# Local Prometheus endpoint, disabled when unset
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
+# Days of lobby rows kept for players nobody tracks, 0 keeps everything
+MATCH_RETENTION_DAYS = int(os.getenv("MATCH_RETENTION_DAYS") or DEFAULT_RETENTION_DAYS)
+# Hours between maintenance runs, each waits for a quiet hour
+MAINTENANCE_HOURS = float(os.getenv("MAINTENANCE_HOURS") or 24)
+# Seeded as the first guild's "kills >= N" alert rule on first run
+KILLS_MAX = int(os.getenv("KILLS_MAX") or 0) or None
 
 # ====== DISCORD BOT ======
 intents = discord.Intents.default()
 discord.Intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+bot = commands.AutoShardedBot(command_prefix='!', intents=intents)
 
-@tasks.loop(minutes=15)
+async def resolve_channel(channel_id: int):
+    return bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+
+def startup_stage(stage: str):
+    elapsed = time.perf_counter() - PROCESS_START
+    STARTUP_SECONDS.set(elapsed, stage=stage)
+    log.info("startup stage done", extra={"stage": stage, "seconds": round(elapsed, 3)})
+
+scheduler = PollScheduler()
+
+# Each player has their own next poll time, this only checks who is due
+@tasks.loop(minutes=1)
 async def check_leetify():
-    channel = bot.get_channel(TARGET_CHANNEL_ID)
-    if channel is None:
-        print("Channel not found!")
-        return
+    try:
+        due = scheduler.due(await get_tracked_players())
+        if due:
+            channels = await get_channels_by_player()
+            await poll_roster({steamid: channels.get(steamid, []) for steamid in due}, bot.leetify, POLL_CONCURRENCY)
+            await scheduler.plan(due)
+            bot.outbox.wake()
+    except Exception as e:
+        log.exception("poll tick failed", extra={"error": repr(e)})
+    if check_leetify.current_loop == 0:
+        startup_stage("first_poll")
 
+# Retention, vacuum and statistics once per MAINTENANCE_HOURS, in a quiet hour
+@tasks.loop(minutes=15)
+async def maintain():
     try:
-        matches = await fetch_latest_matches(TARGET_STEAM64, LEETIFY_TOKEN)
-        await process_matches(matches, channel, TARGET_STEAM64, LEETIFY_TOKEN)
+        now = time.time()
+        last = await get_state("maintenance_last_run")
+        if last is None:
+            await set_state("maintenance_last_run", str(int(now)))
+            return
+        waited = now - float(last)
+        if waited < MAINTENANCE_HOURS * 3600:
+            return
+        # A roster that never goes quiet still gets a run once it is a day overdue
+        if waited < MAINTENANCE_HOURS * 3600 + 86400 and not await is_quiet(await get_tracked_players(), now):
+            return
+        await run_maintenance(MATCH_RETENTION_DAYS)
+        await set_state("maintenance_last_run", str(int(now)))
     except Exception as e:
-        print(f"Error fetching matches: {e}")
+        log.exception("maintenance failed", extra={"error": repr(e)})
 
-# ====== READY ======
+# ====== STARTUP ======
 @bot.event
-async def on_ready():
+async def setup_hook():
     """
-    Docstring for on_ready
+    Runs once per process, after login and before the gateway connects.
+    Reconnects only fire on_ready again, so nothing here is repeated.
     """
-    print(f"Logged in as {bot.user}")
-
     await init_db()
+    await seed_tracked_players()
+    startup_stage("database")
+    # Percentile arrays load in the background, the first post waits if needed
+    bot.analytics_task = asyncio.create_task(ENGINE.load())
+    bot.analytics_task.add_done_callback(analytics_loaded)
+
+    # Polling only needs Leetify and the database, so it starts before the
+    # command sync and the gateway handshake
+    bot.outbox.start()
     check_leetify.start()
+    maintain.start()
+
+    await load_cogs()
+    startup_stage("cogs")
 
     try:
-        if GUILD_ID:
+        await sync_commands()
+    except Exception as e:
+        log.error("slash sync failed", extra={"error": repr(e)})
+    startup_stage("sync")
+
+def analytics_loaded(task):
+    """Posts skip percentiles instead of waiting on an engine that failed to load."""
+    if task.cancelled() or task.exception() is None:
+        return
+    ENGINE.mark_unavailable(task.exception())
+    log.error("percentile engine failed to load, posting without percentiles", extra={
+        "error": repr(task.exception()),
+    })
+
+@bot.event
+async def on_ready():
+    """
+    Called on every gateway (re)connect
+    """
+    log.info("logged in", extra={"user": str(bot.user)})
+
+def command_tree_hash(guild: discord.abc.Snowflake | None) -> str:
+    """Hash of the payload tree.sync would upload for this scope."""
+    payload = sorted(
+        (command.to_dict(bot.tree) for command in bot.tree.get_commands(guild=guild)),
+        key=lambda command: (command["type"], command["name"])
+    )
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+async def sync_scope(guild: discord.abc.Snowflake | None):
+    """Sync one scope unless the same tree was already synced to it."""
+    key = f"command_tree_hash:{guild.id if guild else 'global'}"
+    tree_hash = command_tree_hash(guild)
+    if await get_state(key) == tree_hash:
+        log.info("slash commands unchanged, skipping sync", extra={"scope": key})
+        return
+    await bot.tree.sync(guild=guild)
+    await set_state(key, tree_hash)
+    log.info("slash commands synced", extra={"scope": key})
+
+async def sync_commands():
+    if GUILD_ID:
+        try:
+            await sync_scope(discord.Object(id=int(GUILD_ID)))
+            return
+        except Exception as e:
+            log.warning("guild sync failed, falling back to global sync", extra={"error": repr(e)})
+    await sync_scope(None)
+
+async def seed_tracked_players():
+    """
+    Put the players and channel configured in the env on the roster, once.
+    Later changes go through /config so they survive restarts.
+    """
+    if await get_state("env_seeded"):
+        return
+    players = ([TARGET_STEAM64] if TARGET_STEAM64 else []) + TRACKED_PLAYERS
+    for steamid in players:
+        await add_tracked_player(steamid)
+    if TARGET_STEAM64:
+        await claim_legacy_cursor(TARGET_STEAM64)
+
+    # Single-guild env config becomes that guild's config on first run
+    if TARGET_CHANNEL_ID:
+        guild_id = int(GUILD_ID) if GUILD_ID else None
+        if guild_id is None:
             try:
-                await bot.tree.sync(guild=discord.Object(id=int(GUILD_ID)))
-                print(f"Slash commands synced to guild {GUILD_ID}.")
+                guild_id = (await resolve_channel(TARGET_CHANNEL_ID)).guild.id
             except Exception as e:
-                print("Guild sync error, falling back to global sync:", repr(e))
-                await bot.tree.sync()
-                print("Slash commands synced globally.")
-        else:
-            await bot.tree.sync()
-            print("Slash commands synced globally.")
-    except Exception as e:
-        print("Slash sync error:", repr(e))
+                log.warning("could not resolve TARGET_CHANNEL_ID", extra={"error": repr(e)})
+                return
+        await seed_guild_config(guild_id, TARGET_CHANNEL_ID, KILLS_MAX, players)
+    await set_state("env_seeded", "1")
 
 async def load_cogs():
     for filename in os.listdir("./cogs"):
@@ -80,9 +217,22 @@ async def load_cogs():
 
 # Run bot
 async def main():
-    async with bot:
-        await load_cogs()
-        await bot.start(DISCORD_TOKEN)
+    async with bot, LeetifyClient(
+        LEETIFY_TOKEN, base_url=LEETIFY_URL, rate=LEETIFY_RATE, burst=LEETIFY_BURST, profile_ttl=PROFILE_TTL
+    ) as leetify:
+        bot.leetify = leetify
+        bot.outbox = OutboxWorker(resolve_channel, leetify)
+        metrics_runner = await start_metrics_server(METRICS_PORT) if METRICS_PORT else None
+        lag_task = asyncio.create_task(monitor_loop_lag())
+        try:
+            await bot.start(DISCORD_TOKEN)
+        finally:
+            await bot.outbox.stop()
+            lag_task.cancel()
+            if metrics_runner is not None:
+                await metrics_runner.cleanup()
+            await close_db()
 
 import asyncio
-asyncio.run(main())
+if __name__ == "__main__":
+    asyncio.run(main())
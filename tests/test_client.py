@@ -0,0 +1,97 @@
+"""
+Circuit breaker and retry policy of the Leetify client against a local
+aiohttp server
+
+    python -m pytest tests
+"""
+
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from utils.client import LeetifyClient, LeetifyUnavailable
+
+async def serve(handler):
+    app = web.Application()
+    app.router.add_get("/v3/profile", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+def half_open(client: LeetifyClient):
+    """Trip the breaker with its cooldown already over."""
+    client.breaker.failures = client.breaker.threshold
+    client.breaker.opened_at = time.monotonic() - client.breaker.cooldown
+
+def test_bad_json_trial_reopens_and_allows_next_trial():
+    async def run():
+        responses = [web.Response(text="<html>maintenance</html>", content_type="text/html"),
+                     web.json_response({"name": "ok"})]
+
+        async def handler(request):
+            return responses.pop(0)
+
+        runner, url = await serve(handler)
+        try:
+            async with LeetifyClient("token", base_url=url, max_retries=0) as client:
+                half_open(client)
+                with pytest.raises(LeetifyUnavailable):
+                    await client.get_profile("1")
+                assert client.breaker.state == "open"
+                assert not client.breaker._trial
+
+                client.breaker.opened_at = time.monotonic() - client.breaker.cooldown
+                assert await client.get_profile("1") == {"name": "ok"}
+                assert client.breaker.state == "closed"
+        finally:
+            await runner.cleanup()
+    asyncio.run(run())
+
+def test_cancelled_trial_is_released():
+    async def run():
+        started, finish = asyncio.Event(), asyncio.Event()
+
+        async def handler(request):
+            started.set()
+            await finish.wait()
+            return web.json_response({})
+
+        runner, url = await serve(handler)
+        try:
+            async with LeetifyClient("token", base_url=url, max_retries=0) as client:
+                half_open(client)
+                task = asyncio.create_task(client.get_profile("1"))
+                await started.wait()
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+                assert client.breaker.state == "half-open"
+                assert client.breaker.allow()
+        finally:
+            finish.set()
+            await runner.cleanup()
+    asyncio.run(run())
+
+def test_long_retry_after_fails_instead_of_sleeping():
+    async def run():
+        calls = []
+
+        async def handler(request):
+            calls.append(request)
+            return web.Response(status=429, headers={"Retry-After": "3600"})
+
+        runner, url = await serve(handler)
+        try:
+            async with LeetifyClient("token", base_url=url) as client:
+                with pytest.raises(LeetifyUnavailable):
+                    await asyncio.wait_for(client.get_profile("1"), 5)
+                assert len(calls) == 1
+                assert client.breaker.failures == 1
+        finally:
+            await runner.cleanup()
+    asyncio.run(run())
@@ -0,0 +1,73 @@
+"""
+Schema upkeep of an existing database across restarts
+
+    python -m pytest tests
+"""
+
+import asyncio
+import json
+import random
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.synthetic import generate_match
+from utils import database
+from utils.records import decode_matches
+
+def matches(seed: int, players: list[str], count: int, start: datetime) -> list:
+    """Parsed like a Leetify response, so payloads are archived too."""
+    rng = random.Random(seed)
+    raw = [generate_match(rng, players, start + timedelta(hours=i)) for i in range(count)]
+    return decode_matches(json.dumps(raw).encode())
+
+def test_new_field_is_added_to_a_current_database(tmp_path):
+    path = str(tmp_path / "bot.db")
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    async def create():
+        await database.init_db(path)
+        await database.insert_matches(matches(0, ["a"], 3, start))
+        await database.close_db()
+    asyncio.run(create())
+
+    # A database at the current schema version that predates a FIELDS entry
+    with sqlite3.connect(path) as conn:
+        conn.execute("ALTER TABLE match_history DROP COLUMN mvps")
+
+    async def restart():
+        await database.init_db(path)
+        try:
+            assert await database.insert_matches(matches(1, ["a"], 2, start + timedelta(days=1)))
+            assert await database.reindex_matches() == (5, 5 * 10)
+            return await database.get_db().fetchone("SELECT COUNT(mvps) FROM match_history")
+        finally:
+            await database.close_db()
+    assert asyncio.run(restart()) == (5 * 10,)
+
+def test_reindex_does_not_bring_back_pruned_rows_of_a_newly_tracked_player(tmp_path):
+    async def run():
+        await database.init_db(str(tmp_path / "bot.db"))
+        try:
+            db = database.get_db()
+            await database.add_tracked_player("a")
+            await database.insert_matches(matches(0, ["a"], 5, datetime(2024, 1, 1, tzinfo=timezone.utc)))
+            lobby = (await db.fetchone("SELECT steam64_id FROM match_history WHERE steam64_id != 'a' LIMIT 1"))[0]
+
+            pruned = await database.prune_lobby_rows(int(datetime.now(timezone.utc).timestamp()))
+            assert pruned == 5 * 9
+            assert await db.fetchone("SELECT COUNT(*) FROM player_map_stats WHERE steam64_id != 'a'") == (0,)
+            totals = await db.fetchone("SELECT matches, kills FROM player_pruned_totals WHERE steam64_id = ?", (lobby,))
+            assert totals[0] == 1
+
+            # Tracked only after their rows were pruned
+            await database.add_tracked_player(lobby)
+            assert await database.reindex_matches() == (5, 5)
+            assert await db.fetchone("SELECT COUNT(*) FROM match_history WHERE steam64_id = ?", (lobby,)) == (0,)
+            assert await db.fetchall("SELECT * FROM player_map_stats WHERE steam64_id = ?", (lobby,)) == []
+            assert await db.fetchone(
+                "SELECT matches, kills FROM player_pruned_totals WHERE steam64_id = ?", (lobby,)
+            ) == totals
+            assert await db.fetchone("SELECT SUM(matches) FROM player_map_stats WHERE steam64_id = 'a'") == (5,)
+        finally:
+            await database.close_db()
+    asyncio.run(run())
@@ -0,0 +1,136 @@
+"""
+Alert rule helper
+
+Rules live in alert_rules, per guild and optionally for a single player,
+and are compiled into predicates when the guild config is loaded (see
+utils/guilds.py), so once per config change. process_matches runs every
+rule that applies to the player over a whole batch of new matches in one
+pass. Streak rules ("rating < -2 for 3 matches in a row") look back at the
+player's previous matches with one query per batch, however many rules
+and guilds there are.
+"""
+
+import operator
+
+from utils.database import get_recent_rows
+from utils.records import COLUMN_INDEX, Match, PlayerRow
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "=": operator.eq,
+}
+
+# Names offered in /config alert: (column, label, scale). Ratings are stored
+# as fractions and shown times 100, so thresholds are given the same way.
+STATS = {
+    "kills": ("total_kills", "kills", 1),
+    "deaths": ("total_deaths", "deaths", 1),
+    "assists": ("total_assists", "assists", 1),
+    "kd": ("kd_ratio", "K/D", 1),
+    "damage": ("total_damage", "damage", 1),
+    "adr": ("dpr", "ADR", 1),
+    "mvps": ("mvps", "MVPs", 1),
+    "rating": ("leetify_rating", "rating", 100),
+    "accuracy": ("accuracy", "accuracy", 1),
+    "aces": ("multi5k", "aces", 1),
+    "4ks": ("multi4k", "4Ks", 1),
+    "team_hits": ("shots_hit_friend", "shots into teammates", 1),
+    "team_flashes": ("flashbang_hit_friend", "teammates flashed", 1),
+    "team_he_damage": ("he_friends_damage_avg", "HE damage to teammates", 1),
+}
+
+_BY_COLUMN = {column: (name, label, scale) for name, (column, label, scale) in STATS.items()}
+
+class Rule:
+    """One alert_rules row with its predicate compiled."""
+    __slots__ = ("id", "guild_id", "steam64_id", "stat", "op", "threshold", "streak", "test")
+
+    def __init__(self, id: int, guild_id: int, steam64_id: str | None, stat: str, op: str, threshold: float,
+                 streak: int = 1):
+        if stat not in COLUMN_INDEX:
+            raise ValueError(f"unknown stat {stat!r}")
+        if op not in OPERATORS:
+            raise ValueError(f"unknown operator {op!r}")
+        self.id = id
+        self.guild_id = guild_id
+        self.steam64_id = steam64_id
+        self.stat = stat
+        self.op = op
+        self.threshold = threshold
+        self.streak = max(streak, 1)
+        self.test = _compile(stat, op, threshold)
+
+    def applies_to(self, steam64_id: str) -> bool:
+        return self.steam64_id is None or self.steam64_id == steam64_id
+
+    def describe(self) -> str:
+        _, label, _ = _BY_COLUMN.get(self.stat, (None, self.stat, 1))
+        text = f"{label} {self.op} {self.threshold:g}"
+        if self.streak > 1:
+            text += f" for {self.streak} matches in a row"
+        return text
+
+    def alert(self, row: PlayerRow) -> str:
+        """The line added to the post when the rule fires."""
+        _, label, scale = _BY_COLUMN.get(self.stat, (None, self.stat, 1))
+        value = row[self.stat] * scale
+        if self.streak > 1:
+            return f"🚨 **{label} {self.op} {self.threshold:g} for {self.streak} matches in a row**"
+        return f"🚨 **{value:g} {label}!**"
+
+def _compile(stat: str, op: str, threshold: float):
+    """A predicate over a match_history row tuple. NULL stats never match."""
+    index = COLUMN_INDEX[stat]
+    compare = OPERATORS[op]
+    scale = _BY_COLUMN.get(stat, (None, None, 1))[2]
+    if scale != 1:
+        threshold = threshold / scale
+
+    def test(values: tuple) -> bool:
+        value = values[index]
+        return value is not None and compare(value, threshold)
+    return test
+
+def _fires(rule: Rule, rows: list[PlayerRow], i: int) -> bool:
+    """
+    Whether `rule` fires on rows[i]. A streak rule fires once, on the match
+    that completes the run, and not again until the run is broken.
+    """
+    if rule.streak == 1:
+        return rule.test(rows[i].values)
+    start = i + 1 - rule.streak
+    if start < 0 or not all(rule.test(row.values) for row in rows[start:i + 1]):
+        return False
+    return start == 0 or not rule.test(rows[start - 1].values)
+
+async def evaluate(steam64_id: str, matches: list[Match], rules_by_channel: dict[int, list[Rule]]
+                   ) -> dict[tuple[str, int], list[str]]:
+    """
+    Alert lines for new `matches` of one player (oldest first), per
+    (match_id, channel_id), given each announce channel's rules.
+    """
+    rules_by_channel = {
+        channel_id: [rule for rule in rules if rule.applies_to(steam64_id)]
+        for channel_id, rules in rules_by_channel.items()
+    }
+    rules_by_channel = {channel_id: rules for channel_id, rules in rules_by_channel.items() if rules}
+    rows = [row for row in (match.player(steam64_id) for match in matches) if row is not None]
+    if not rules_by_channel or not rows:
+        return {}
+
+    # Enough earlier matches to complete or rule out any streak, one query for all rules
+    lookback = max(rule.streak for rules in rules_by_channel.values() for rule in rules)
+    history = await get_recent_rows(steam64_id, rows[0]["finished_at"], lookback) if lookback > 1 else []
+    window = history + rows
+
+    alerts = {}
+    for i in range(len(history), len(window)):
+        match_id = window[i]["match_id"]
+        for channel_id, rules in rules_by_channel.items():
+            lines = [rule.alert(window[i]) for rule in rules if _fires(rule, window, i)]
+            if lines:
+                alerts[(match_id, channel_id)] = lines
+    return alerts
@@ -0,0 +1,179 @@
+"""
+Analytics helper
+
+Percentiles of a match's stats against the player's own history and
+against every lobby player in match_history. Each stat column is kept as
+a sorted NumPy float32 array, so a percentile is two searchsorted calls.
+New rows go to a small unsorted tail that is merged in once it grows past
+MERGE_AT rows.
+
+Memory is 4 bytes per row and stat: about 7 MiB for the lobby index at
+300k rows, plus the tracked players' own rows. A merge briefly holds the
+old and the merged copy of one column at a time.
+"""
+
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from utils.database import get_db, get_generation, get_tracked_players
+from utils.records import PlayerRow
+
+log = logging.getLogger(__name__)
+
+# The stats match posts show (PERCENTILE_FIELDS in utils/leetify.py), only
+# these are indexed
+STAT_COLUMNS = (
+    "total_kills", "kd_ratio", "total_damage", "leetify_rating", "accuracy", "trade_kills_success_percentage",
+)
+
+MERGE_AT = 1024
+
+def _as_array(rows: list) -> np.ndarray:
+    """Rows of stat values to a float32 matrix, NULL becomes NaN."""
+    return np.array(rows, dtype=np.float32).reshape(len(rows), len(STAT_COLUMNS))
+
+class ColumnIndex:
+    """Every stat column as its own sorted float32 array, plus an unsorted tail of recent rows."""
+
+    def __init__(self):
+        self._columns = [np.empty(0, dtype=np.float32) for _ in STAT_COLUMNS]
+        self._rows = 0
+        self._counts = np.zeros(len(STAT_COLUMNS), dtype=np.int64)  # non-NaN per column
+        self._tail: list[np.ndarray] = []
+        self._tail_rows = 0
+
+    def __len__(self) -> int:
+        return self._rows + self._tail_rows
+
+    def extend(self, values: np.ndarray):
+        self._tail.append(values)
+        self._tail_rows += len(values)
+
+    def _tail_array(self) -> np.ndarray:
+        if len(self._tail) > 1:
+            self._tail = [np.concatenate(self._tail)]
+        return self._tail[0]
+
+    def compact(self):
+        """Merge the tail into the sorted columns."""
+        if not self._tail_rows:
+            return
+        tail = self._tail_array()
+        for i, column in enumerate(self._columns):
+            # NaN sorts last, so every column stays one sorted run with the
+            # NULLs at the end. np.insert merges in a single linear pass.
+            new = np.sort(tail[:, i])
+            self._columns[i] = np.insert(column, np.searchsorted(column, new), new)
+        self._counts += np.count_nonzero(~np.isnan(tail), axis=0)
+        self._rows += len(tail)
+        self._tail, self._tail_rows = [], 0
+
+    def percentiles(self, values: np.ndarray) -> np.ndarray:
+        """Mid-rank percentile of each value in its column, NaN where unknown."""
+        below = np.empty(len(values), dtype=np.int64)
+        equal = np.empty(len(values), dtype=np.int64)
+        for i, (column, value) in enumerate(zip(self._columns, values)):
+            below[i] = column.searchsorted(value, side="left")
+            equal[i] = column.searchsorted(value, side="right") - below[i]
+        total = self._counts.astype(np.float64)
+
+        if self._tail_rows:
+            tail = self._tail_array()
+            below = below + np.count_nonzero(tail < values, axis=0)
+            equal = equal + np.count_nonzero(tail == values, axis=0)
+            total = total + np.count_nonzero(~np.isnan(tail), axis=0)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = 100.0 * (below + 0.5 * equal) / total
+        result[np.isnan(values)] = np.nan
+        return result
+
+class PercentileEngine:
+    """
+    Lobby wide and per tracked player column indexes over match_history,
+    loaded once and then topped up with rows newer than the last rowid seen.
+    """
+
+    def __init__(self, chunk: int = 5000):
+        self.chunk = chunk
+        self.lobby = ColumnIndex()
+        self.players: dict[str, ColumnIndex] = {}
+        self._last_rowid = 0
+        self._generation = None
+        self._lock = asyncio.Lock()
+        # Why load() failed. Until a restart posts go out without percentiles
+        self.error: BaseException | None = None
+
+    def mark_unavailable(self, error: BaseException):
+        self.error = error
+
+    def _select(self, where: str) -> str:
+        return f"SELECT rowid, steam64_id, {', '.join(STAT_COLUMNS)} FROM match_history WHERE {where} ORDER BY rowid"
+
+    async def refresh(self):
+        """Append rows inserted since the last refresh."""
+        if self.error is not None:
+            return
+        async with self._lock:
+            if self._generation == get_generation():
+                return
+            self._generation = get_generation()
+            start = time.perf_counter()
+            loaded = 0
+            async for rows in get_db().stream(self._select("rowid > ?"), (self._last_rowid,), self.chunk):
+                values = _as_array([row[2:] for row in rows])
+                self.lobby.extend(values)
+                for i, row in enumerate(rows):
+                    index = self.players.get(row[1])
+                    if index is not None:
+                        index.extend(values[i:i + 1])
+                self._last_rowid = rows[-1][0]
+                loaded += len(rows)
+            await self._compact(MERGE_AT)
+            if loaded:
+                log.info("percentile index updated", extra={
+                    "rows": loaded, "total": len(self.lobby), "seconds": round(time.perf_counter() - start, 3),
+                })
+
+    async def _compact(self, min_tail: int):
+        """Merge tails in a thread, callers hold the lock so nothing reads meanwhile."""
+        indexes = [index for index in (self.lobby, *self.players.values()) if index._tail_rows >= min_tail]
+        if indexes:
+            await asyncio.to_thread(lambda: [index.compact() for index in indexes])
+
+    async def _player(self, steam64_id: str) -> ColumnIndex:
+        async with self._lock:
+            index = self.players.get(steam64_id)
+            if index is None:
+                # Rows after _last_rowid are added by the next refresh
+                index = self.players[steam64_id] = ColumnIndex()
+                async for rows in get_db().stream(
+                    self._select("steam64_id = ? AND rowid <= ?"), (steam64_id, self._last_rowid), self.chunk
+                ):
+                    index.extend(_as_array([row[2:] for row in rows]))
+            return index
+
+    async def load(self):
+        """Build the indexes up front instead of on the first post."""
+        await self.refresh()
+        for steam64_id in await get_tracked_players():
+            await self._player(steam64_id)
+        async with self._lock:
+            await self._compact(1)
+
+    async def compare(self, row: PlayerRow) -> dict[str, tuple[float, float]]:
+        """{column: (percentile in own history, percentile in the lobby)} for a match_history row."""
+        if self.error is not None:
+            raise RuntimeError("percentile engine is unavailable") from self.error
+        await self.refresh()
+        values = np.array([row[name] if row[name] is not None else np.nan for name in STAT_COLUMNS], dtype=np.float32)
+        player = await self._player(row["steam64_id"])
+        async with self._lock:
+            own = player.percentiles(values)
+            lobby = self.lobby.percentiles(values)
+        return {name: (own[i], lobby[i]) for i, name in enumerate(STAT_COLUMNS)}
+
+ENGINE = PercentileEngine()
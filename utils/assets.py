@@ -0,0 +1,80 @@
+"""
+Asset helper
+
+Map and result images are read from disk once and served from memory.
+Posts use a single pre-composited scorecard image per (map, result, score),
+rendered in a worker thread so Pillow never blocks the event loop.
+"""
+
+import asyncio
+import io
+import logging
+from functools import lru_cache
+from pathlib import Path
+
+import discord
+
+log = logging.getLogger(__name__)
+
+ASSET_DIR = Path("assets")
+FALLBACK_MAP = "misc"
+
+_MAPS: dict[str, bytes] = {}
+_RESULTS: dict[str, bytes] = {}
+
+def load_assets(root: str | Path = ASSET_DIR):
+    """Read every map and result PNG into memory."""
+    root = Path(root)
+    _MAPS.update({path.stem: path.read_bytes() for path in (root / "maps").glob("*.png")})
+    _RESULTS.update({path.stem: path.read_bytes() for path in (root / "match").glob("*.png")})
+    scorecard.cache_clear()
+    log.info("loaded assets", extra={"maps": len(_MAPS), "results": len(_RESULTS)})
+
+def _ensure_loaded():
+    if not _MAPS:
+        load_assets()
+
+def map_image(map_name: str) -> bytes:
+    _ensure_loaded()
+    return _MAPS.get(map_name) or _MAPS[FALLBACK_MAP]
+
+def result_image(result: str) -> bytes:
+    _ensure_loaded()
+    return _RESULTS[result]
+
+@lru_cache(maxsize=256)
+def scorecard(map_name: str, result: str, score: int | None, enemy_score: int | None) -> bytes:
+    """Result banner with the map icon and final score drawn on it, as PNG bytes."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    banner = Image.open(io.BytesIO(result_image(result))).convert("RGBA")
+    icon = Image.open(io.BytesIO(map_image(map_name))).convert("RGBA")
+
+    size = banner.height - 26
+    icon = icon.resize((size, size), Image.Resampling.NEAREST)
+    banner.alpha_composite(icon, (13, 13))
+
+    draw = ImageDraw.Draw(banner)
+    font = ImageFont.load_default(size=30)
+    small = ImageFont.load_default(size=16)
+
+    score_text = f"{score if score is not None else '?'} : {enemy_score if enemy_score is not None else '?'}"
+    right = banner.width - 16
+    draw.text((right, banner.height // 2 - 8), score_text, font=font, anchor="rm",
+              fill="white", stroke_width=2, stroke_fill="black")
+    draw.text((right, banner.height - 10), map_name, font=small, anchor="rd",
+              fill="white", stroke_width=1, stroke_fill="black")
+
+    # A 256 colour palette keeps the PNG around a fifth of the RGBA size
+    buffer = io.BytesIO()
+    banner.quantize(256, method=Image.Quantize.FASTOCTREE).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+async def scorecard_file(map_name: str, result: str, score: int | None, enemy_score: int | None,
+                         filename: str = "scorecard.png") -> discord.File:
+    try:
+        png = await asyncio.to_thread(scorecard, map_name, result, score, enemy_score)
+    except ImportError:
+        # No Pillow: send the plain banner, still from memory
+        png = result_image(result)
+    return discord.File(io.BytesIO(png), filename=filename)
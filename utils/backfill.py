@@ -0,0 +1,108 @@
+"""
+Historical backfill
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from utils.client import LeetifyClient
+from utils.database import get_state, set_state, insert_matches
+
+log = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+
+def checkpoint_key(steamid: str) -> str:
+    return f"backfill:{steamid}"
+
+class BackfillProgress:
+    def __init__(self, players: int):
+        self.players = players
+        self.players_done = 0
+        self.pages = 0
+        self.matches = 0
+        self.rows = 0
+        self.started = time.monotonic()
+
+    def report(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (
+            f"backfill: {self.players_done}/{self.players} players, {self.pages} pages, "
+            f"{self.matches} matches ({self.matches / elapsed:.1f}/s), "
+            f"{self.rows} new rows ({self.rows / elapsed:.0f}/s), {elapsed:.0f}s"
+        )
+
+async def iter_match_pages(client: LeetifyClient, steamid: str, start_page: int = 0, page_size: int = PAGE_SIZE):
+    """
+    Yield (page, matches) one page at a time, newest first. Stops on an
+    empty page, or when a page repeats the previous one, which is what an
+    endpoint that ignores paging does.
+    """
+    page = start_page
+    previous = None
+    while True:
+        matches = await client.get_match_page(steamid, page, page_size)
+        if not matches:
+            return
+        ids = [match.id for match in matches]
+        if ids == previous:
+            return
+        yield page, matches
+        previous = ids
+        page += 1
+
+async def backfill_player(client: LeetifyClient, steamid: str, progress: BackfillProgress, restart: bool = False):
+    checkpoint = json.loads(await get_state(checkpoint_key(steamid)) or "{}")
+    if restart:
+        checkpoint = {}
+    if checkpoint.get("done"):
+        progress.players_done += 1
+        return
+
+    last_page = checkpoint.get("page", -1)
+    async for page, matches in iter_match_pages(client, steamid, last_page + 1):
+        progress.rows += await insert_matches(matches)
+        progress.pages += 1
+        progress.matches += len(matches)
+        last_page = page
+        await set_state(checkpoint_key(steamid), json.dumps({"page": page, "done": False}))
+
+    await set_state(checkpoint_key(steamid), json.dumps({"page": last_page, "done": True}))
+    progress.players_done += 1
+
+async def run_backfill(
+    client: LeetifyClient,
+    steamids: list[str],
+    concurrency: int = 4,
+    restart: bool = False,
+    report_every: float = 5.0,
+) -> BackfillProgress:
+    """
+    Pull the full match history of every player, `concurrency` players at a
+    time. Each finished page is checkpointed in `state`, so a rerun after an
+    interruption picks up at the next page.
+    """
+    progress = BackfillProgress(len(steamids))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def worker(steamid: str):
+        async with semaphore:
+            try:
+                await backfill_player(client, steamid, progress, restart)
+            except Exception as e:
+                log.warning("backfill stopped, will resume from its checkpoint", extra={"steam64": steamid, "error": repr(e)})
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(report_every)
+            log.info(progress.report())
+
+    report_task = asyncio.create_task(reporter())
+    try:
+        await asyncio.gather(*(worker(steamid) for steamid in steamids))
+    finally:
+        report_task.cancel()
+    log.info(progress.report())
+    return progress
@@ -0,0 +1,83 @@
+"""
+Cache helper
+"""
+
+import asyncio
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    Async read-through cache with a time to live.
+
+    Concurrent misses for the same key share one load (single-flight).
+    Entries can be marked stale to force a reload on the next read, and if
+    a reload fails the last good value is served instead of the error.
+    """
+
+    def __init__(self, loader, ttl: float):
+        self.loader = loader
+        self.ttl = ttl
+        self._entries: dict = {}  # key -> [value, loaded_at, stale]
+        self._pending: dict = {}
+
+    def _fresh(self, entry) -> bool:
+        return not entry[2] and time.monotonic() - entry[1] < self.ttl
+
+    def invalidate(self, key):
+        """Mark an entry stale. It is still served if the reload fails."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[2] = True
+
+    async def _load(self, key):
+        try:
+            value = await self.loader(key)
+        except Exception:
+            entry = self._entries.get(key)
+            if entry is None:
+                raise
+            log.warning("serving stale cache entry", extra={"key": key})
+            return entry[0]
+        self._entries[key] = [value, time.monotonic(), False]
+        return value
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and self._fresh(entry):
+            return entry[0]
+
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+class GenerationCache:
+    """
+    Keeps results until `generation()` changes. Used for read queries over
+    match_history, which only change when an insert bumps the generation.
+    """
+
+    def __init__(self, generation, maxsize: int = 256):
+        self.generation = generation
+        self.maxsize = maxsize
+        self._entries: dict = {}  # key -> (generation, value)
+
+    async def get(self, key, loader):
+        current = self.generation()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == current:
+            return entry[1]
+
+        value = await loader()
+        if len(self._entries) >= self.maxsize:
+            # Anything from an older generation is dead weight
+            self._entries = {k: v for k, v in self._entries.items() if v[0] == current}
+            if len(self._entries) >= self.maxsize:
+                self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = (current, value)
+        return value
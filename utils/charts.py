@@ -0,0 +1,79 @@
+"""
+Chart helper
+"""
+
+import asyncio
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+def render_trend(title: str, labels: list[str], values: list[float], ylabel: str) -> bytes:
+    """Draw a line chart and return it as PNG bytes. Runs in a worker process."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 4), dpi=100)
+    try:
+        ax.plot(labels, values, marker="o", color="#5865F2")
+        ax.set_title(title)
+        ax.set_ylabel(ylabel)
+        ax.grid(alpha=0.3)
+        ax.tick_params(axis="x", labelrotation=45, labelsize=8)
+        fig.tight_layout()
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png")
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
+
+class ChartRenderer:
+    """
+    Renders charts in a process pool so the event loop never runs matplotlib.
+    Finished PNGs are kept in an LRU, and concurrent requests for the same
+    key share one render.
+    """
+
+    def __init__(self, workers: int = 2, cache_size: int = 128):
+        self.workers = workers
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple, bytes] = OrderedDict()
+        self._pending: dict[tuple, asyncio.Future] = {}
+        self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, not fork: the bot process has sqlite and aiohttp threads running
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def render(self, key: tuple, *args) -> bytes:
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        if key in self._pending:
+            return await asyncio.shield(self._pending[key])
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_pool(), render_trend, *args)
+        self._pending[key] = future
+        try:
+            png = await future
+        finally:
+            del self._pending[key]
+
+        self._cache[key] = png
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return png
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
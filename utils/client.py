@@ -0,0 +1,250 @@
+"""
+Leetify HTTP client
+"""
+
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+from utils.cache import TTLCache
+from utils.metrics import API_SECONDS, API_ERRORS, API_THROTTLED
+from utils.records import Match, loads, parse_matches
+
+URL = "https://api-public.cs-prod.leetify.com"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Longest Retry-After we sleep through, a longer one counts as an outage
+MAX_RETRY_AFTER = 60.0
+
+class LeetifyUnavailable(Exception):
+    """Raised when the circuit breaker is open or retries are exhausted."""
+
+class TokenBucket:
+    """Allows `rate` requests per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` failed requests in a row and rejects calls for
+    `cooldown` seconds. After that one trial request is let through
+    (half-open), and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial = False
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """End a trial that finished without an outcome, e.g. a cancelled request."""
+        self._trial = False
+
+def retry_after(headers) -> float | None:
+    """Seconds to wait according to a Retry-After header, if there is one."""
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class LeetifyClient:
+    """
+    Long-lived Leetify API client owned by the bot. One pooled keep-alive
+    session is shared by every request, and all requests go through the
+    rate limiter, the retry policy and the circuit breaker.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        base_url: str = URL,
+        rate: float = 2.0,
+        burst: int = 5,
+        max_retries: int = 4,
+        backoff: float = 1.0,
+        pool_size: int = 20,
+        timeout: float = 20.0,
+        profile_ttl: float = 600.0,
+    ):
+        self.token = token
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+        self.session: aiohttp.ClientSession | None = None
+        # Cached /v3/profile lookups, see get_cached_profile
+        self.profiles = TTLCache(self.get_profile, profile_ttl)
+
+    async def start(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={
+                    "Authorization": f"Bearer {self.token}",
+                    "Accept": "application/json",
+                },
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _delay(self, attempt: int, headers=None) -> float:
+        wait = retry_after(headers) if headers is not None else None
+        if wait is not None:
+            return wait
+        # Full jitter: anywhere between 0 and the exponential cap
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    async def get_json(self, path: str, params: dict | None = None):
+        trial = self.breaker.state == "half-open"
+        if not self.breaker.allow():
+            API_ERRORS.inc(endpoint=path, kind="circuit_open")
+            raise LeetifyUnavailable("circuit open, Leetify looks down")
+        await self.start()
+
+        with API_SECONDS.time(endpoint=path):
+            try:
+                return await self._get_json(path, params)
+            finally:
+                # However the trial ended (cancelled, say), the next one may go
+                if trial:
+                    self.breaker.release()
+
+    async def _get_json(self, path: str, params: dict | None):
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                async with self.session.get(f"{self.base_url}{path}", params=params) as r:
+                    if r.status in RETRY_STATUSES:
+                        if r.status == 429:
+                            API_THROTTLED.inc(endpoint=path)
+                        API_ERRORS.inc(endpoint=path, kind=str(r.status))
+                        delay = self._delay(attempt, r.headers)
+                    else:
+                        r.raise_for_status()
+                        data = loads(await r.read())
+                        delay = None
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                API_ERRORS.inc(endpoint=path, kind=type(e).__name__)
+                if attempt == self.max_retries:
+                    break
+                await asyncio.sleep(self._delay(attempt))
+                continue
+            except aiohttp.ClientResponseError as e:
+                # Any other 4xx is our fault, not an outage
+                API_ERRORS.inc(endpoint=path, kind=str(e.status))
+                self.breaker.record_success()
+                raise
+            except (aiohttp.ClientError, ValueError) as e:
+                # A truncated or non-JSON body (an HTML error page with 200)
+                API_ERRORS.inc(endpoint=path, kind=type(e).__name__)
+                self.breaker.record_failure()
+                raise LeetifyUnavailable(f"bad response from {path}: {e!r}") from e
+
+            if delay is not None:
+                if delay > MAX_RETRY_AFTER:
+                    self.breaker.record_failure()
+                    raise LeetifyUnavailable(f"{path} asked to retry after {delay:.0f}s")
+                # Sleep after the response is released so the connection goes back to the pool
+                if attempt == self.max_retries:
+                    break
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return data
+
+        self.breaker.record_failure()
+        raise LeetifyUnavailable(f"giving up on {path} after {self.max_retries + 1} attempts")
+
+    async def get_matches(self, steamid: str) -> list[Match]:
+        return parse_matches(await self.get_json("/v3/profile/matches", {"steam64_id": steamid}) or [])
+
+    async def get_match_page(self, steamid: str, page: int, page_size: int) -> list[Match]:
+        return parse_matches(await self.get_json(
+            "/v3/profile/matches",
+            {"steam64_id": steamid, "page": page, "limit": page_size},
+        ) or [])
+
+    async def get_profile(self, steamid: str):
+        return await self.get_json("/v3/profile", {"steam64_id": steamid})
+
+    async def get_cached_profile(self, steamid: str):
+        """Profile from the TTL cache, shared between posts and commands."""
+        return await self.profiles.get(steamid)
@@ -2,376 +2,1471 @@
 Database helper
 """
 
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Iterable
 import aiosqlite
 
+from utils.archive import archive_row, unpack
+from utils.metrics import INSERT_SECONDS, ROWS_INSERTED, ROWS_SKIPPED, track_db_size
+from utils.records import FIELDS, COLUMNS, Match, PlayerRow, loads, parse_match
+from utils.trends import Trend, match_result
+
+log = logging.getLogger(__name__)
+
 DB_FILE = "database.db"
 
-async def init_db():
-    async with aiosqlite.connect(DB_FILE) as db:
-        # State
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS state (
-                key TEXT PRIMARY KEY,
-                value TEXT
+PRAGMAS = (
+    # Only takes effect on a new file, and only before the switch to WAL.
+    # Older databases need one full VACUUM, see vacuum_full.
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",   # 256 MiB
+    "PRAGMA cache_size=-32768",     # 32 MiB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+class Database:
+    """
+    Persistent connections for the life of the bot.
+
+    Every write is queued to a single writer task that owns the only write
+    connection. The writer drains whatever is queued (up to `batch_size`
+    jobs) and runs it as one transaction, each job in its own savepoint so
+    a failing job does not take the rest of the batch with it. Jobs queued
+    with `transaction=False` (VACUUM, checkpoints) run on their own between
+    batches. Reads use a small pool of separate read-only connections and
+    never wait on the writer thanks to WAL.
+    """
+
+    def __init__(self, path: str = DB_FILE, readers: int = 2, batch_size: int = 64):
+        self.path = path
+        self.readers = readers
+        self.batch_size = batch_size
+        self._writer_conn = None
+        self._reader_pool = None
+        self._queue = None
+        self._writer_task = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer_task is not None
+
+    async def _connect(self, readonly: bool = False):
+        conn = await aiosqlite.connect(self.path, isolation_level=None)
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        if readonly:
+            await conn.execute("PRAGMA query_only=1")
+        return conn
+
+    async def open(self):
+        if self.is_open:
+            return
+        self._writer_conn = await self._connect()
+        self._reader_pool = asyncio.Queue()
+        for _ in range(self.readers):
+            self._reader_pool.put_nowait(await self._connect(readonly=True))
+        self._queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer())
+
+    async def close(self):
+        if not self.is_open:
+            return
+        await self._queue.put(None)
+        await self._writer_task
+        self._writer_task = None
+        await self._writer_conn.close()
+        while not self._reader_pool.empty():
+            await self._reader_pool.get_nowait().close()
+
+    async def _writer(self):
+        conn = self._writer_conn
+        stopping = False
+        held = None
+        while not stopping:
+            job, held = held or await self._queue.get(), None
+            if job is None:
+                break
+            fn, future, transaction = job
+            if not transaction:
+                try:
+                    result, error = await fn(conn), None
+                except Exception as e:
+                    result, error = None, e
+                self._settle([(future, result, error)])
+                continue
+
+            batch = [(fn, future)]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                job = self._queue.get_nowait()
+                if job is None:
+                    stopping = True
+                    break
+                if not job[2]:
+                    held = job
+                    break
+                batch.append(job[:2])
+
+            results = []
+            try:
+                await conn.execute("BEGIN IMMEDIATE")
+                for fn, future in batch:
+                    await conn.execute("SAVEPOINT job")
+                    try:
+                        results.append((future, await fn(conn), None))
+                        await conn.execute("RELEASE job")
+                    except Exception as e:
+                        await conn.execute("ROLLBACK TO job")
+                        await conn.execute("RELEASE job")
+                        results.append((future, None, e))
+                await conn.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    await conn.execute("ROLLBACK")
+                results = [(future, None, e) for _, future in batch]
+            self._settle(results)
+
+    @staticmethod
+    def _settle(results: list[tuple]):
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def write(self, fn, transaction: bool = True):
+        """
+        Queue `fn(conn)` for the writer and wait until its batch is committed.
+        With `transaction=False` it runs alone, outside any transaction.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((fn, future, transaction))
+        return await future
+
+    async def execute(self, sql: str, params=()):
+        async def job(conn):
+            await conn.execute(sql, params)
+        await self.write(job)
+
+    async def executemany(self, sql: str, rows):
+        async def job(conn):
+            await conn.executemany(sql, rows)
+        await self.write(job)
+
+    @asynccontextmanager
+    async def read(self):
+        conn = await self._reader_pool.get()
+        try:
+            yield conn
+        finally:
+            self._reader_pool.put_nowait(conn)
+
+    async def fetchone(self, sql: str, params=()):
+        async with self.read() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+
+    async def fetchall(self, sql: str, params=()):
+        async with self.read() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+
+    async def stream(self, sql: str, params=(), chunk: int = 1000):
+        """
+        Yield rows `chunk` at a time from one cursor. Uses its own read-only
+        connection so a long export does not hold one of the pooled readers.
+        """
+        conn = await self._connect(readonly=True)
+        try:
+            async with conn.execute(sql, params) as cursor:
+                while rows := await cursor.fetchmany(chunk):
+                    yield rows
+        finally:
+            await conn.close()
+
+MATCH_HISTORY_DDL = (
+    "CREATE TABLE IF NOT EXISTS match_history (\n    "
+    + ",\n    ".join(f"{name} {sql_type}" for name, sql_type in FIELDS)
+    + ",\n    PRIMARY KEY (match_id, steam64_id)\n)"
+)
+
+INSERT_MATCH_SQL = (
+    f"INSERT OR IGNORE INTO match_history ({', '.join(COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(COLUMNS))})"
+)
+
+# Used by reindex: an upsert keeps each row's rowid, which the history pager
+# and the percentile engine rely on
+REINDEX_MATCH_SQL = (
+    f"INSERT INTO match_history ({', '.join(COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(COLUMNS))}) "
+    f"ON CONFLICT (match_id, steam64_id) DO UPDATE SET "
+    + ", ".join(f"{name} = excluded.{name}" for name in COLUMNS[2:])
+)
+
+INSERT_ARCHIVE_SQL = "INSERT OR IGNORE INTO match_archive VALUES (?, ?, ?, ?, ?, ?)"
+
+# Rollup tables kept up to date by insert_matches: (table, key column,
+# SQL expression that buckets a match_history row into that key)
+ROLLUPS = (
+    ("player_daily_stats", "day", "date(finished_at, 'unixepoch')"),
+    ("player_weekly_stats", "week", "date(finished_at, 'unixepoch', 'weekday 0', '-6 days')"),
+    ("player_map_stats", "map_name", "map_name"),
+)
+
+ROLLUP_COLUMNS = ("matches", "wins", "kills", "deaths", "rounds", "rating_sum", "rating_count")
+
+def _rollup_select(expr: str, where: str) -> str:
+    """(steam64_id, key, *ROLLUP_COLUMNS) of the match_history rows matching `where`."""
+    return f"""
+        SELECT
+            steam64_id,
+            {expr} AS key,
+            COUNT(*) AS matches,
+            COALESCE(SUM(win), 0) AS wins,
+            COALESCE(SUM(total_kills), 0) AS kills,
+            COALESCE(SUM(total_deaths), 0) AS deaths,
+            COALESCE(SUM(rounds_count), 0) AS rounds,
+            COALESCE(SUM(leetify_rating), 0) AS rating_sum,
+            COUNT(leetify_rating) AS rating_count
+        FROM match_history
+        WHERE {where}
+        GROUP BY 1, 2
+    """
+
+def _rollup_sql(table: str, key: str, expr: str, where: str) -> str:
+    return f"""
+        INSERT INTO {table} (steam64_id, {key}, {", ".join(ROLLUP_COLUMNS)})
+        {_rollup_select(expr, where)}
+        ON CONFLICT (steam64_id, {key}) DO UPDATE SET
+            {", ".join(f"{c} = {c} + excluded.{c}" for c in ROLLUP_COLUMNS)}
+    """
+
+def _unrollup_sql(table: str, key: str, expr: str, where: str) -> str:
+    """Take the match_history rows matching `where` back out of a rollup table."""
+    return f"""
+        UPDATE {table} SET {", ".join(f"{c} = {table}.{c} - gone.{c}" for c in ROLLUP_COLUMNS)}
+        FROM ({_rollup_select(expr, where)}) AS gone
+        WHERE {table}.steam64_id = gone.steam64_id AND {table}.{key} = gone.key
+    """
+
+def _chunks(items: list, size: int = 500):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+_db: Database | None = None
+
+# Bumped after every insert that added rows; read caches key on it
+_generation = 0
+_config_generation = 0
+
+def get_generation() -> int:
+    return _generation
+
+def get_config_generation() -> int:
+    """Bumped by every guild config write, see utils/guilds.py."""
+    return _config_generation
+
+def get_db() -> Database:
+    if _db is None or not _db.is_open:
+        raise RuntimeError("Database is not open, call init_db() first")
+    return _db
+
+async def close_db():
+    global _db
+    if _db is not None:
+        await _db.close()
+        _db = None
+
+# ====== MIGRATIONS ======
+# Each step runs once, in its own transaction, and is recorded in
+# schema_version. Steps 1-4 use IF NOT EXISTS because databases created
+# before schema_version existed already have some of these tables.
+# Add new steps at the end, never edit one that has shipped.
+
+async def _migrate_base(db):
+    # State
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+
+    # Tracked players, each with its own last posted match cursor
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS tracked_players (
+            steam64_id TEXT PRIMARY KEY,
+            last_match_id TEXT,
+            added_at INTEGER NOT NULL
+        )
+    """)
+
+    # Match history table
+    await db.execute(MATCH_HISTORY_DDL)
+
+    # Older databases are missing some of the FIELDS columns
+    await _add_missing_columns(db)
+
+    # Index for fast /history queries
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_match_history_steam_time
+        ON match_history (steam64_id, finished_at DESC)
+    """)
+
+    # Rows inserted / skipped by each poll
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_log (
+            logged_at INTEGER NOT NULL,
+            steam64_id TEXT NOT NULL,
+            rows_inserted INTEGER NOT NULL,
+            rows_skipped INTEGER NOT NULL
+        )
+    """)
+
+async def _add_missing_columns(db) -> list[str]:
+    """
+    Add FIELDS entries match_history does not have yet. Also run by init_db
+    on every start, so adding a stat to FIELDS needs no migration.
+    """
+    async with db.execute("PRAGMA table_info(match_history)") as cursor:
+        existing = {row[1] for row in await cursor.fetchall()}
+    added = []
+    for name, sql_type in FIELDS:
+        if name not in existing:
+            await db.execute(f"ALTER TABLE match_history ADD COLUMN {name} {sql_type.replace(' NOT NULL', '')}")
+            added.append(name)
+    return added
+
+def _rollup_table_sql(table: str, key: str) -> str:
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            steam64_id TEXT NOT NULL,
+            {key} TEXT NOT NULL,
+            {", ".join(f"{c} {'REAL' if c == 'rating_sum' else 'INTEGER'} NOT NULL" for c in ROLLUP_COLUMNS)},
+            PRIMARY KEY (steam64_id, {key})
+        )
+    """
+
+async def _migrate_rollups(db):
+    # Per-player daily / weekly / per-map aggregates for /history
+    for table, key, _ in ROLLUPS:
+        await db.execute(_rollup_table_sql(table, key))
+    await rebuild_rollups(db)
+
+async def _migrate_outbox(db):
+    # Match posts waiting for Discord, oldest first per channel
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            match_id TEXT NOT NULL,
+            steam64_id TEXT NOT NULL,
+            channel_id INTEGER NOT NULL,
+            finished_at INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at INTEGER NOT NULL,
+            sent_at INTEGER,
+            UNIQUE (match_id, steam64_id, channel_id)
+        )
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON outbox (status, finished_at, id)
+    """)
+
+async def _migrate_trends(db):
+    # Running streak / EWMA / rolling rating state per tracked player
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS player_trends (
+            steam64_id TEXT PRIMARY KEY,
+            last_finished_at INTEGER NOT NULL,
+            matches INTEGER NOT NULL,
+            streak_result TEXT,
+            streak_length INTEGER NOT NULL,
+            ewma_rating REAL,
+            recent_ratings TEXT NOT NULL
+        )
+    """)
+
+async def _migrate_guilds(db):
+    # Per-guild announce channel and thresholds
+    await db.execute("""
+        CREATE TABLE guild_config (
+            guild_id INTEGER PRIMARY KEY,
+            channel_id INTEGER,
+            kills_max INTEGER,
+            updated_at INTEGER NOT NULL
+        )
+    """)
+    # Which players each guild follows. tracked_players stays the polled
+    # roster and holds the one cursor per player shared by every guild.
+    await db.execute("""
+        CREATE TABLE guild_players (
+            guild_id INTEGER NOT NULL,
+            steam64_id TEXT NOT NULL,
+            added_at INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, steam64_id)
+        )
+    """)
+    await db.execute("CREATE INDEX idx_guild_players_steam ON guild_players (steam64_id)")
+
+async def _migrate_archive(db):
+    # Compressed raw payload of every match, see utils/archive.py
+    await db.execute("""
+        CREATE TABLE match_archive (
+            match_id TEXT PRIMARY KEY,
+            sha256 BLOB NOT NULL,
+            codec TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            archived_at INTEGER NOT NULL
+        )
+    """)
+
+async def _migrate_alerts(db):
+    # Alert rules per guild, optionally for one player. KILLS_MAX / kills_max
+    # becomes a "total_kills >= N" rule.
+    await db.execute("""
+        CREATE TABLE alert_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            steam64_id TEXT,
+            stat TEXT NOT NULL,
+            op TEXT NOT NULL,
+            threshold REAL NOT NULL,
+            streak INTEGER NOT NULL DEFAULT 1,
+            created_at INTEGER NOT NULL
+        )
+    """)
+    await db.execute("""
+        INSERT INTO alert_rules (guild_id, stat, op, threshold, created_at)
+        SELECT guild_id, 'total_kills', '>=', kills_max, updated_at FROM guild_config WHERE kills_max IS NOT NULL
+    """)
+    await db.execute("ALTER TABLE guild_config DROP COLUMN kills_max")
+    # Alerts that fired for a queued post, as a JSON list of lines
+    await db.execute("ALTER TABLE outbox ADD COLUMN alerts TEXT")
+
+async def _migrate_maintenance(db):
+    # Rollup totals of lobby rows deleted by retention, see prune_lobby_rows
+    # (dropped again by migration 9)
+    for table, key, _ in ROLLUPS:
+        await db.execute(_rollup_table_sql(f"{table}_pruned", key))
+    # Covers the leaderboard and /compare queries, see LEADERBOARD_COLUMNS
+    await db.execute("""
+        CREATE INDEX idx_match_history_leaderboard ON match_history (
+            steam64_id, finished_at DESC, name, leetify_rating, total_kills, total_deaths, total_damage,
+            rounds_count, trade_kills_succeed, trade_kill_attempts, he_thrown, he_foes_damage_avg
+        )
+    """)
+
+PRUNED_TOTALS_DDL = f"""
+    CREATE TABLE player_pruned_totals (
+        steam64_id TEXT PRIMARY KEY,
+        {", ".join(f"{c} {'REAL' if c == 'rating_sum' else 'INTEGER'} NOT NULL" for c in ROLLUP_COLUMNS)}
+    )
+"""
+
+async def _migrate_pruned_totals(db):
+    # Retention used to copy every pruned row's daily, weekly and map rollup
+    # rows into *_pruned tables, which grew the rollups instead of shrinking
+    # them. Pruned rows now collapse into one row per player and leave the
+    # rollups, which then always match match_history.
+    await db.execute(PRUNED_TOTALS_DDL)
+    await db.execute(f"""
+        INSERT INTO player_pruned_totals
+        SELECT steam64_id, {", ".join(f"SUM({c})" for c in ROLLUP_COLUMNS)}
+        FROM player_map_stats_pruned
+        GROUP BY steam64_id
+    """)
+    for table, _, _ in ROLLUPS:
+        await db.execute(f"DROP TABLE {table}_pruned")
+    await rebuild_rollups(db)
+
+MIGRATIONS = (
+    (1, "base tables", _migrate_base),
+    (2, "history rollups", _migrate_rollups),
+    (3, "outbox", _migrate_outbox),
+    (4, "player trends", _migrate_trends),
+    (5, "guild config", _migrate_guilds),
+    (6, "match archive", _migrate_archive),
+    (7, "alert rules", _migrate_alerts),
+    (8, "retention and leaderboard index", _migrate_maintenance),
+    (9, "pruned rows as per-player totals", _migrate_pruned_totals),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+async def get_schema_version(db: Database) -> int:
+    if await db.fetchone("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'") is None:
+        return 0
+    return (await db.fetchone("SELECT COALESCE(MAX(version), 0) FROM schema_version"))[0]
+
+async def migrate(db: Database) -> list[int]:
+    """Apply the migrations this database has not seen yet. Returns their versions."""
+    current = await get_schema_version(db)
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(f"database schema v{current} is newer than this code (v{SCHEMA_VERSION})")
+
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+
+        async def job(conn, version=version, description=description, step=step):
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at INTEGER NOT NULL
+                )
+            """)
+            await step(conn)
+            await conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, int(datetime.now().timestamp()))
             )
-        """)
 
-        await db.execute("""
-            INSERT OR IGNORE INTO state (key, value)
-            VALUES ('last_match_id', NULL)
-        """)
+        await db.write(job)
+        log.info("applied migration", extra={"version": version, "description": description})
+        applied.append(version)
+    return applied
+
+async def init_db(path: str = DB_FILE):
+    """Open the database and bring its schema up to date. Safe to call again."""
+    global _db
+    if _db is not None:
+        return
+    db = Database(path)
+    await db.open()
+    try:
+        applied = await migrate(db)
+        added = await db.write(_add_missing_columns)
+    except Exception:
+        await db.close()
+        raise
+    _db = db
+    track_db_size(db.path)
+    log.info("initialized database", extra={
+        "path": db.path, "schema_version": SCHEMA_VERSION, "migrated": applied, "added_columns": added,
+    })
+
+async def get_state(key: str) -> str | None:
+    row = await get_db().fetchone("SELECT value FROM state WHERE key = ?", (key,))
+    return row[0] if row else None
+
+async def set_state(key: str, value: str | None):
+    await get_db().execute(
+        "INSERT INTO state (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (key, value)
+    )
+
+async def add_tracked_player(steam64_id: str):
+    await get_db().execute(
+        "INSERT OR IGNORE INTO tracked_players (steam64_id, added_at) VALUES (?, ?)",
+        (steam64_id, int(datetime.now().timestamp()))
+    )
+
+GUILD_SETTINGS = ("channel_id",)
+
+async def _write_config(job):
+    global _config_generation
+    result = await get_db().write(job)
+    _config_generation += 1
+    return result
 
-        # Match history table
+async def get_guild_config_rows() -> tuple[list[tuple], list[tuple], list[tuple]]:
+    """
+    (guild_id, channel_id) rows, (guild_id, steam64_id) rows and
+    (id, guild_id, steam64_id, stat, op, threshold, streak) alert rule rows.
+    """
+    configs = await get_db().fetchall("SELECT guild_id, channel_id FROM guild_config")
+    players = await get_db().fetchall(
+        "SELECT guild_id, steam64_id FROM guild_players ORDER BY added_at, steam64_id"
+    )
+    rules = await get_db().fetchall(
+        "SELECT id, guild_id, steam64_id, stat, op, threshold, streak FROM alert_rules ORDER BY id"
+    )
+    return configs, players, rules
+
+async def set_guild_setting(guild_id: int, setting: str, value):
+    if setting not in GUILD_SETTINGS:
+        raise ValueError(f"unknown guild setting {setting!r}")
+
+    async def job(db):
+        await db.execute(f"""
+            INSERT INTO guild_config (guild_id, {setting}, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (guild_id) DO UPDATE SET {setting} = excluded.{setting}, updated_at = excluded.updated_at
+        """, (guild_id, value, int(datetime.now().timestamp())))
+    await _write_config(job)
+
+async def add_guild_player(guild_id: int, steam64_id: str) -> bool:
+    """Follow a player in a guild, and poll them if nobody did yet. False if already followed."""
+    now = int(datetime.now().timestamp())
+
+    async def job(db):
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO guild_players (guild_id, steam64_id, added_at) VALUES (?, ?, ?)",
+            (guild_id, steam64_id, now)
+        )
+        await db.execute(
+            "INSERT OR IGNORE INTO tracked_players (steam64_id, added_at) VALUES (?, ?)",
+            (steam64_id, now)
+        )
+        return cursor.rowcount > 0
+    return await _write_config(job)
+
+async def remove_guild_player(guild_id: int, steam64_id: str) -> bool:
+    """Unfollow a player. Players no guild follows anymore are no longer polled."""
+    async def job(db):
+        cursor = await db.execute(
+            "DELETE FROM guild_players WHERE guild_id = ? AND steam64_id = ?",
+            (guild_id, steam64_id)
+        )
         await db.execute("""
-            CREATE TABLE IF NOT EXISTS match_history (
-                match_id TEXT NOT NULL,
-                steam64_id TEXT NOT NULL,
-
-                finished_at INTEGER NOT NULL,
-                data_source TEXT NOT NULL,
-                data_source_match_id TEXT,
-                map_name TEXT NOT NULL,
-                has_banned_player INTEGER NOT NULL,
-
-                initial_team_number INTEGER,
-                team_score INTEGER,
-                enemy_team_score INTEGER,
-                win INTEGER,
-
-                name TEXT,
-
-                total_kills INTEGER,
-                total_deaths INTEGER,
-                total_assists INTEGER,
-                total_hs_kills INTEGER,
-                kd_ratio REAL,
-                mvps INTEGER,
-                score INTEGER,
-
-                total_damage INTEGER,
-                dpr REAL,
-                rounds_count INTEGER,
-                rounds_survived INTEGER,
-                rounds_survived_percentage REAL,
-                rounds_won INTEGER,
-                rounds_lost INTEGER,
-
-                accuracy REAL,
-                accuracy_enemy_spotted REAL,
-                accuracy_head REAL,
-                spray_accuracy REAL,
-                preaim REAL,
-                reaction_time REAL,
-
-                shots_fired INTEGER,
-                shots_fired_enemy_spotted INTEGER,
-                shots_hit_foe INTEGER,
-                shots_hit_foe_head INTEGER,
-                shots_hit_friend INTEGER,
-                shots_hit_friend_head INTEGER,
-
-                utility_on_death_avg REAL,
-                he_thrown INTEGER,
-                he_foes_damage_avg REAL,
-                he_friends_damage_avg REAL,
-                molotov_thrown INTEGER,
-                smoke_thrown INTEGER,
-                flashbang_thrown INTEGER,
-                flashbang_hit_foe INTEGER,
-                flashbang_hit_friend INTEGER,
-                flashbang_leading_to_kill INTEGER,
-                flashbang_hit_foe_avg_duration REAL,
-                flash_assist INTEGER,
-
-                counter_strafing_shots_all INTEGER,
-                counter_strafing_shots_good INTEGER,
-                counter_strafing_shots_bad INTEGER,
-                counter_strafing_shots_good_ratio REAL,
-
-                trade_kill_opportunities INTEGER,
-                trade_kill_attempts INTEGER,
-                trade_kills_succeed INTEGER,
-                trade_kill_attempts_percentage REAL,
-                trade_kills_success_percentage REAL,
-                trade_kill_opportunities_per_round REAL,
-
-                traded_death_opportunities INTEGER,
-                traded_death_attempts INTEGER,
-                traded_deaths_succeed INTEGER,
-                traded_death_attempts_percentage REAL,
-                traded_deaths_success_percentage REAL,
-                traded_deaths_opportunities_per_round REAL,
-
-                multi1k INTEGER,
-                multi2k INTEGER,
-                multi3k INTEGER,
-                multi4k INTEGER,
-                multi5k INTEGER,
-
-                leetify_rating REAL,
-                ct_leetify_rating REAL,
-                t_leetify_rating REAL,
-
-                PRIMARY KEY (match_id, steam64_id)
+            DELETE FROM tracked_players
+            WHERE steam64_id = ? AND NOT EXISTS (SELECT 1 FROM guild_players WHERE steam64_id = ?)
+        """, (steam64_id, steam64_id))
+        return cursor.rowcount > 0
+    return await _write_config(job)
+
+async def add_alert_rule(guild_id: int, steam64_id: str | None, stat: str, op: str, threshold: float,
+                         streak: int = 1) -> int:
+    """Store a rule, see utils/alerts.py for what the fields mean. Returns its id."""
+    async def job(db):
+        cursor = await db.execute("""
+            INSERT INTO alert_rules (guild_id, steam64_id, stat, op, threshold, streak, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (guild_id, steam64_id, stat, op, threshold, streak, int(datetime.now().timestamp())))
+        return cursor.lastrowid
+    return await _write_config(job)
+
+async def remove_alert_rule(guild_id: int, rule_id: int) -> bool:
+    async def job(db):
+        cursor = await db.execute("DELETE FROM alert_rules WHERE id = ? AND guild_id = ?", (rule_id, guild_id))
+        return cursor.rowcount > 0
+    return await _write_config(job)
+
+async def seed_guild_config(guild_id: int, channel_id: int, kills_max: int | None, steam64_ids: list[str]):
+    """First-run config from the env. Settings the guild already has are kept."""
+    now = int(datetime.now().timestamp())
+
+    async def job(db):
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO guild_config (guild_id, channel_id, updated_at) VALUES (?, ?, ?)",
+            (guild_id, channel_id, now)
+        )
+        if cursor.rowcount and kills_max:
+            await db.execute(
+                "INSERT INTO alert_rules (guild_id, stat, op, threshold, created_at) VALUES (?, 'total_kills', '>=', ?, ?)",
+                (guild_id, kills_max, now)
             )
-        """)
+        await db.executemany(
+            "INSERT OR IGNORE INTO guild_players (guild_id, steam64_id, added_at) VALUES (?, ?, ?)",
+            [(guild_id, steam64_id, now) for steam64_id in steam64_ids]
+        )
+        await db.executemany(
+            "INSERT OR IGNORE INTO tracked_players (steam64_id, added_at) VALUES (?, ?)",
+            [(steam64_id, now) for steam64_id in steam64_ids]
+        )
+    await _write_config(job)
+
+async def get_tracked_players() -> list[str]:
+    rows = await get_db().fetchall(
+        "SELECT steam64_id FROM tracked_players ORDER BY added_at, steam64_id"
+    )
+    return [row[0] for row in rows]
 
-        # Index for fast /history queries
+async def claim_legacy_cursor(steam64_id: str):
+    """Move the old global 'last_match_id' state row onto a player's cursor."""
+    async def job(db):
         await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_match_history_steam_time
-            ON match_history (steam64_id, finished_at DESC)
-        """)
+            UPDATE tracked_players
+            SET last_match_id = (SELECT value FROM state WHERE key = 'last_match_id')
+            WHERE steam64_id = ? AND last_match_id IS NULL
+        """, (steam64_id,))
+        await db.execute("DELETE FROM state WHERE key = 'last_match_id'")
+    await get_db().write(job)
+
+async def get_last_match_id(steam64_id: str):
+    row = await get_db().fetchone(
+        "SELECT last_match_id FROM tracked_players WHERE steam64_id = ?",
+        (steam64_id,)
+    )
+    return row[0] if row else None
+
+
+async def set_last_match_id(steam64_id: str, match_id: str):
+    await get_db().execute(
+        "UPDATE tracked_players SET last_match_id = ? WHERE steam64_id = ?",
+        (match_id, steam64_id)
+    )
+
+async def get_known_match_ids(match_ids: list[str]) -> set[str]:
+    """Which of these matches are already stored. One lookup on the primary key."""
+    if not match_ids:
+        return set()
+    async with get_db().read() as db:
+        return await _known_match_ids(db, match_ids)
+
+async def ingest_matches(matches: list[Match], steam64_id: str) -> tuple[int, int]:
+    """
+    Store only the matches we have not seen before and log how many player
+    rows were inserted and skipped. Returns (rows_inserted, rows_skipped).
+    """
+    known = await get_known_match_ids([match.id for match in matches])
+
+    new = [match for match in matches if match.id not in known]
+    inserted = await insert_matches(new)
+    skipped = sum(len(match.rows) for match in matches) - inserted
+    ROWS_INSERTED.inc(inserted)
+    ROWS_SKIPPED.inc(skipped)
+
+    await get_db().execute(
+        "INSERT INTO ingest_log (logged_at, steam64_id, rows_inserted, rows_skipped) VALUES (?, ?, ?, ?)",
+        (int(datetime.now().timestamp()), steam64_id, inserted, skipped)
+    )
+    return inserted, skipped
+
+async def enqueue_posts(steam64_id: str, channel_ids: list[int], matches: list[Match],
+                        alerts: dict[tuple[str, int], list[str]] | None = None):
+    """
+    Queue posts for `matches` (oldest first) in every channel and move the
+    player's cursor to the newest one, in one transaction so a crash cannot
+    lose or repeat a post. `alerts` holds the alert lines that fired per
+    (match_id, channel_id).
+    """
+    now = int(datetime.now().timestamp())
+    alerts = alerts or {}
+
+    def alert_text(match_id: str, channel_id: int) -> str | None:
+        lines = alerts.get((match_id, channel_id))
+        return json.dumps(lines) if lines else None
+
+    async def job(db):
+        await db.executemany("""
+            INSERT OR IGNORE INTO outbox (match_id, steam64_id, channel_id, finished_at, created_at, alerts)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [
+            (match.id, steam64_id, channel_id, match.finished_at, now, alert_text(match.id, channel_id))
+            for match in matches
+            for channel_id in channel_ids
+        ])
+        await db.execute(
+            "UPDATE tracked_players SET last_match_id = ? WHERE steam64_id = ?",
+            (matches[-1].id, steam64_id)
+        )
+
+    await get_db().write(job)
+
+async def get_pending_posts(now: int, limit: int = 50) -> list[tuple]:
+    """
+    (id, match_id, steam64_id, channel_id, attempts, next_attempt_at, alerts)
+    of the oldest pending post of each channel, if it is due by `now`,
+    oldest match first. Posts behind a head waiting for its retry stay
+    queued, so channels get their posts in order and a failing channel does
+    not crowd the others out.
+    """
+    rows = await get_db().fetchall("""
+        SELECT id, match_id, steam64_id, channel_id, attempts, next_attempt_at, alerts
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY channel_id ORDER BY finished_at, id) AS position
+            FROM outbox
+            WHERE status = 'pending'
+        )
+        WHERE position = 1 AND next_attempt_at <= ?
+        ORDER BY finished_at, id
+        LIMIT ?
+    """, (now, limit))
+    return [(*row[:6], json.loads(row[6]) if row[6] else []) for row in rows]
+
+async def mark_post_sent(post_id: int):
+    await get_db().execute(
+        "UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+        (int(datetime.now().timestamp()), post_id)
+    )
+
+async def mark_post_failed(post_id: int, error: str, next_attempt_at: int, give_up: bool = False,
+                           counted: bool = True):
+    """`counted` False retries the post without using up an attempt."""
+    await get_db().execute("""
+        UPDATE outbox
+        SET attempts = attempts + ?, last_error = ?, next_attempt_at = ?, status = ?
+        WHERE id = ?
+    """, (int(counted), error, next_attempt_at, "failed" if give_up else "pending", post_id))
+
+async def get_recent_rows(steam64_id: str, before: int, limit: int) -> list[PlayerRow]:
+    """The player's last `limit` match_history rows finished before `before`, oldest first."""
+    rows = await get_db().fetchall(f"""
+        SELECT {', '.join(COLUMNS)} FROM match_history
+        WHERE steam64_id = ? AND finished_at < ?
+        ORDER BY finished_at DESC
+        LIMIT ?
+    """, (steam64_id, before, limit))
+    return [PlayerRow(row) for row in reversed(rows)]
+
+async def get_match_row(match_id: str, steam64_id: str) -> PlayerRow | None:
+    row = await get_db().fetchone(
+        f"SELECT {', '.join(COLUMNS)} FROM match_history WHERE match_id = ? AND steam64_id = ?",
+        (match_id, steam64_id)
+    )
+    return PlayerRow(row) if row else None
+
+async def get_rollup(table: str, steam64_id: str, limit: int, since: str | None = None) -> list[tuple]:
+    """
+    Newest `limit` rollup rows for a player: (key, matches, wins, kills,
+    deaths, rounds, avg rating). `since` keeps day and week keys from that
+    date (YYYY-MM-DD) on, so gaps do not stretch the window.
+    """
+    key = next(key for name, key, _ in ROLLUPS if name == table)
+    where, params = "steam64_id = ?", [steam64_id]
+    if since is not None:
+        where += f" AND {key} >= ?"
+        params.append(since)
+    return await get_db().fetchall(f"""
+        SELECT {key}, matches, wins, kills, deaths, rounds,
+               CASE WHEN rating_count > 0 THEN rating_sum / rating_count END
+        FROM {table}
+        WHERE {where}
+        ORDER BY {"matches DESC" if key == "map_name" else f"{key} DESC"}
+        LIMIT ?
+    """, (*params, limit))
+
+# Per-player aggregates over their last N matches for /leaderboard and /compare
+# Everything they read, all in idx_match_history_leaderboard so neither query touches the table
+LEADERBOARD_COLUMNS = (
+    "steam64_id", "finished_at", "name", "leetify_rating", "total_kills", "total_deaths", "total_damage",
+    "rounds_count", "trade_kills_succeed", "trade_kill_attempts", "he_thrown", "he_foes_damage_avg",
+)
+LEADERBOARD_METRICS = {
+    "rating": "AVG(leetify_rating) * 100",
+    "kd": "CAST(SUM(total_kills) AS REAL) / MAX(SUM(total_deaths), 1)",
+    "adr": "CAST(SUM(total_damage) AS REAL) / MAX(SUM(rounds_count), 1)",
+    "trade": "CAST(SUM(trade_kills_succeed) AS REAL) / MAX(SUM(trade_kill_attempts), 1) * 100",
+    "utility": "AVG(COALESCE(he_thrown * he_foes_damage_avg, 0))",
+}
+
+# The players a guild follows, see add_guild_player
+GUILD_ROSTER_SQL = "steam64_id IN (SELECT steam64_id FROM guild_players WHERE guild_id = {})"
+
+def _leaderboard_sql(scope: str) -> str:
+    tracked = "WHERE " + GUILD_ROSTER_SQL.format(":guild_id") if scope == "tracked" else ""
+    metrics = ",\n".join(f"{expr} AS {name}" for name, expr in LEADERBOARD_METRICS.items())
+    return f"""
+        WITH recent AS (
+            SELECT {", ".join(LEADERBOARD_COLUMNS)}, ROW_NUMBER() OVER (
+                PARTITION BY steam64_id ORDER BY finished_at DESC
+            ) AS n
+            FROM match_history
+            {tracked}
+        ),
+        totals AS (
+            SELECT steam64_id,
+                   MAX(CASE WHEN n = 1 THEN name END) AS name,
+                   COUNT(*) AS matches,
+                   {metrics}
+            FROM recent
+            WHERE n <= :last
+            GROUP BY steam64_id
+            HAVING COUNT(*) >= :min_matches
+        )
+        SELECT RANK() OVER (ORDER BY {{metric}} DESC) AS rank, *
+        FROM totals
+        ORDER BY rank
+        LIMIT :limit
+    """
+
+async def get_leaderboard(metric: str, scope: str = "tracked", last: int = 20,
+                          min_matches: int = 5, limit: int = 10, guild_id: int | None = None) -> list[dict]:
+    """
+    Rank players by `metric` over each player's `last` matches. `scope` is
+    "tracked" for the players `guild_id` follows or "all" for everyone we
+    have shared a lobby with.
+    """
+    if metric not in LEADERBOARD_METRICS:
+        raise ValueError(f"unknown leaderboard metric {metric!r}")
+    sql = _leaderboard_sql(scope).format(metric=metric)
+    params = {"last": last, "min_matches": min_matches, "limit": limit, "guild_id": guild_id}
+    async with get_db().read() as db:
+        async with db.execute(sql, params) as cursor:
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in await cursor.fetchall()]
+
+def iter_match_history(steam64_id: str | None = None, map_name: str | None = None,
+                       since: int | None = None, until: int | None = None, guild_id: int | None = None,
+                       chunk: int = 1000):
+    """
+    match_history rows in COLUMNS order as chunks of tuples, per player and
+    newest first. That order is idx_match_history_steam_time, so SQLite
+    walks the index instead of sorting the whole table. With `guild_id`
+    only the players that guild follows.
+    """
+    where, params = [], []
+    for condition, value in (
+        ("steam64_id = ?", steam64_id),
+        (GUILD_ROSTER_SQL.format("?"), guild_id),
+        ("map_name = ?", map_name),
+        ("finished_at >= ?", since),
+        ("finished_at < ?", until),
+    ):
+        if value is not None:
+            where.append(condition)
+            params.append(value)
+    sql = f"SELECT {', '.join(COLUMNS)} FROM match_history"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return get_db().stream(sql + " ORDER BY steam64_id, finished_at DESC", params, chunk)
+
+async def get_player_summary(steam64_id: str, last: int = 20) -> dict | None:
+    """The leaderboard metrics for one player."""
+    metrics = ", ".join(f"{expr} AS {name}" for name, expr in LEADERBOARD_METRICS.items())
+    async with get_db().read() as db:
+        async with db.execute(f"""
+            SELECT MAX(name) AS name, COUNT(*) AS matches, {metrics}
+            FROM (
+                SELECT {", ".join(LEADERBOARD_COLUMNS)} FROM match_history
+                WHERE steam64_id = ?
+                ORDER BY finished_at DESC
+                LIMIT ?
+            )
+        """, (steam64_id, last)) as cursor:
+            row = await cursor.fetchone()
+            names = [column[0] for column in cursor.description]
+    return dict(zip(names, row)) if row and row[1] else None
+
+async def get_head_to_head(steam64_a: str, steam64_b: str) -> dict:
+    """Matches two players shared, split into same-team and opposing-team results."""
+    row = await get_db().fetchone("""
+        SELECT
+            COUNT(*),
+            SUM(a.initial_team_number = b.initial_team_number),
+            SUM(a.initial_team_number = b.initial_team_number AND a.win = 1),
+            SUM(a.initial_team_number != b.initial_team_number AND a.win = 1),
+            SUM(a.initial_team_number != b.initial_team_number AND b.win = 1)
+        FROM match_history a
+        JOIN match_history b ON b.match_id = a.match_id AND b.steam64_id = ?
+        WHERE a.steam64_id = ?
+    """, (steam64_b, steam64_a))
+    shared, together, together_wins, a_wins, b_wins = (value or 0 for value in row)
+    return {
+        "shared": shared,
+        "together": together,
+        "together_wins": together_wins,
+        "a_wins": a_wins,
+        "b_wins": b_wins,
+    }
+
+async def get_activity_rows(steam64_ids: list[str], since: int) -> list[tuple]:
+    """(steam64_id, hour_of_week, matches, first_finished_at, last_finished_at) since `since`."""
+    if not steam64_ids:
+        return []
+    # Hour 0 is Sunday 00:00 UTC, see utils/schedule.py
+    return await get_db().fetchall(f"""
+        SELECT steam64_id, (finished_at / 3600 + 96) % 168 AS hour, COUNT(*), MIN(finished_at), MAX(finished_at)
+        FROM match_history
+        WHERE steam64_id IN ({", ".join("?" * len(steam64_ids))}) AND finished_at >= ?
+        GROUP BY steam64_id, hour
+    """, (*steam64_ids, since))
+
+# Keyset position in one player's history, newest first: (finished_at, rowid)
+MatchCursor = tuple[int, int]
+
+class MatchSummary:
+    __slots__ = ("match_id", "finished_at", "map_name", "team_score", "enemy_team_score",
+                 "total_kills", "total_deaths", "kd_ratio", "total_damage", "leetify_rating")
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+class MatchPage:
+    __slots__ = ("matches", "next_cursor")
+
+    def __init__(self, matches: list[MatchSummary], next_cursor: MatchCursor | None):
+        self.matches = matches
+        self.next_cursor = next_cursor  # None on the last page
+
+async def get_matches(steam64_id: str, since: int | None = None, until: int | None = None,
+                      map_name: str | None = None, limit: int = 10,
+                      after: MatchCursor | None = None) -> MatchPage:
+    """
+    One page of a player's matches, newest first, starting after `after`.
+    Keyset pagination on idx_match_history_steam_time: every page is an
+    index seek plus `limit` rows, however deep it is.
+    """
+    where, params = ["steam64_id = ?"], [steam64_id]
+    if since is not None:
+        where.append("finished_at >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("finished_at < ?")
+        params.append(until)
+    if map_name is not None:
+        where.append("map_name = ?")
+        params.append(map_name)
+    if after is not None:
+        # The first term is what the index seeks on, the second breaks ties
+        where.append("finished_at <= ? AND (finished_at < ? OR rowid > ?)")
+        params += [after[0], after[0], after[1]]
+
+    rows = await get_db().fetchall(f"""
+        SELECT rowid, {", ".join(MatchSummary.__slots__)}
+        FROM match_history
+        WHERE {" AND ".join(where)}
+        ORDER BY finished_at DESC, rowid
+        LIMIT ?
+    """, (*params, limit + 1))
+
+    matches = [MatchSummary(*row[1:]) for row in rows[:limit]]
+    next_cursor = (rows[limit - 1][2], rows[limit - 1][0]) if len(rows) > limit else None
+    return MatchPage(matches, next_cursor)
 
-        await db.commit()
-        print("initialized database")
+async def get_newest_match_id(steam64_id: str) -> str | None:
+    row = await get_db().fetchone(
+        "SELECT match_id FROM match_history WHERE steam64_id = ? ORDER BY finished_at DESC LIMIT 1",
+        (steam64_id,)
+    )
+    return row[0] if row else None
 
-async def get_last_match_id():
-    async with aiosqlite.connect(DB_FILE) as db:
+async def get_player_name(steam64_id: str) -> str | None:
+    row = await get_db().fetchone(
+        "SELECT name FROM match_history WHERE steam64_id = ? ORDER BY finished_at DESC LIMIT 1",
+        (steam64_id,)
+    )
+    return row[0] if row else None
+
+async def _known_match_ids(db, match_ids: list[str]) -> set[str]:
+    known = set()
+    for chunk in _chunks(match_ids):
+        placeholders = ", ".join("?" * len(chunk))
         async with db.execute(
-            "SELECT value FROM state WHERE key = 'last_match_id'"
+            f"SELECT DISTINCT match_id FROM match_history WHERE match_id IN ({placeholders})",
+            chunk
         ) as cursor:
-            row = await cursor.fetchone()
-            return row[0] if row else None
+            known.update(row[0] for row in await cursor.fetchall())
+    return known
 
+async def update_rollups(db, match_ids: list[str]):
+    """Add freshly inserted matches to the rollup tables. Runs inside the insert transaction."""
+    for chunk in _chunks(match_ids):
+        placeholders = ", ".join("?" * len(chunk))
+        for table, key, expr in ROLLUPS:
+            await db.execute(_rollup_sql(table, key, expr, f"match_id IN ({placeholders})"), chunk)
 
-async def set_last_match_id(match_id: str):
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute(
-            "UPDATE state SET value = ? WHERE key = 'last_match_id'",
-            (match_id,)
+async def rebuild_rollups(db):
+    """Recompute every rollup table from match_history."""
+    for table, key, expr in ROLLUPS:
+        await db.execute(f"DELETE FROM {table}")
+        await db.execute(_rollup_sql(table, key, expr, "true"))
+
+_TREND_COLUMNS = [COLUMNS.index(name) for name in (
+    "steam64_id", "finished_at", "team_score", "enemy_team_score", "leetify_rating"
+)]
+
+def _trend_fields(row: tuple) -> tuple:
+    steam64_id, finished_at, team_score, enemy_score, rating = (row[i] for i in _TREND_COLUMNS)
+    return steam64_id, finished_at, match_result(team_score, enemy_score), rating
+
+async def _save_trend(db, trend: Trend):
+    await db.execute(
+        "INSERT OR REPLACE INTO player_trends VALUES (?, ?, ?, ?, ?, ?, ?)",
+        trend.to_row()
+    )
+
+async def rebuild_trend(db, steam64_id: str) -> Trend:
+    """Recompute one player's trend state from match_history."""
+    trend = Trend(steam64_id)
+    async with db.execute("""
+        SELECT finished_at, team_score, enemy_team_score, leetify_rating
+        FROM match_history
+        WHERE steam64_id = ?
+        ORDER BY finished_at
+    """, (steam64_id,)) as cursor:
+        async for finished_at, team_score, enemy_score, rating in cursor:
+            trend.update(finished_at, match_result(team_score, enemy_score), rating)
+    await _save_trend(db, trend)
+    return trend
+
+async def update_trends(db, rows: list[tuple]):
+    """
+    Fold newly inserted rows of tracked players into player_trends, one
+    constant-time step per match. A player without state yet, or a row
+    older than the stored state (backfill), gets a rebuild instead.
+    """
+    async with db.execute("SELECT steam64_id FROM tracked_players") as cursor:
+        tracked = {row[0] for row in await cursor.fetchall()}
+
+    per_player: dict[str, list] = {}
+    for row in rows:
+        fields = _trend_fields(row)
+        if fields[0] in tracked:
+            per_player.setdefault(fields[0], []).append(fields[1:])
+
+    for steam64_id, matches in per_player.items():
+        matches.sort(key=lambda m: m[0])
+        async with db.execute(
+            "SELECT * FROM player_trends WHERE steam64_id = ?", (steam64_id,)
+        ) as cursor:
+            state = await cursor.fetchone()
+
+        if state is None or matches[0][0] < state[1]:
+            await rebuild_trend(db, steam64_id)
+            continue
+
+        trend = Trend.from_row(state)
+        for finished_at, result, rating in matches:
+            trend.update(finished_at, result, rating)
+        await _save_trend(db, trend)
+
+async def rebuild_trends(steam64_id: str | None = None) -> int:
+    """Rebuild trend state for one player or the whole roster. Returns players rebuilt."""
+    players = [steam64_id] if steam64_id else await get_tracked_players()
+
+    async def job(db):
+        for player in players:
+            await rebuild_trend(db, player)
+
+    await get_db().write(job)
+    return len(players)
+
+async def get_trend(steam64_id: str) -> Trend | None:
+    row = await get_db().fetchone("SELECT * FROM player_trends WHERE steam64_id = ?", (steam64_id,))
+    return Trend.from_row(row) if row else None
+
+async def insert_matches(matches: Iterable[Match]) -> int:
+    """
+    Write a whole poll or backfill page in one transaction with a single
+    prepared statement, and fold the new matches into the rollup tables in
+    that same transaction. Payloads go to match_archive alongside. Returns
+    the number of rows actually inserted.
+    """
+    matches = list(matches)
+    rows_by_match = {match.id: match.rows for match in matches}
+    if not rows_by_match:
+        return 0
+    # Payloads were compressed when parsed, the writer only stores them
+    now = int(datetime.now().timestamp())
+    archive = {match.id: archive_row(match.id, match.archive, now) for match in matches if match.archive is not None}
+
+    async def job(db):
+        # Checked again inside the transaction so a match is never rolled up twice
+        known = await _known_match_ids(db, list(rows_by_match))
+        new_ids = [match_id for match_id in rows_by_match if match_id not in known]
+        rows = [row for match_id in new_ids for row in rows_by_match[match_id]]
+        if not rows:
+            return 0
+        cursor = await db.executemany(INSERT_MATCH_SQL, rows)
+        await db.executemany(INSERT_ARCHIVE_SQL, [archive[match_id] for match_id in new_ids if match_id in archive])
+        await update_rollups(db, new_ids)
+        await update_trends(db, rows)
+        return cursor.rowcount
+
+    global _generation
+    with INSERT_SECONDS.time():
+        inserted = await get_db().write(job)
+    if inserted:
+        _generation += 1
+    return inserted
+
+async def insert_match(match: Match) -> int:
+    return await insert_matches([match])
+
+async def get_archive_stats() -> tuple[int, int, int, int]:
+    """(archived matches, payload bytes, compressed bytes, stored matches without a payload)."""
+    archived, size, compressed = await get_db().fetchone(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length(data)), 0) FROM match_archive"
+    )
+    missing = (await get_db().fetchone("""
+        SELECT COUNT(*) FROM (SELECT DISTINCT match_id FROM match_history)
+        WHERE match_id NOT IN (SELECT match_id FROM match_archive)
+    """))[0]
+    return archived, size, compressed, missing
+
+def _reparse(rows: list[tuple]) -> list[Match]:
+    return [parse_match(loads(unpack(*row[1:]))) for row in rows]
+
+async def _retained_rows(matches: list[Match], cutoff: int) -> list[tuple]:
+    """
+    Rows of `matches` that retention has not deleted: newer than the cutoff,
+    or still in match_history. Who is tracked today does not matter, a
+    player tracked after their rows were pruned does not get them back.
+    """
+    old = [match.id for match in matches if match.finished_at < cutoff]
+    kept = set()
+    for chunk in _chunks(old):
+        kept.update(await get_db().fetchall(
+            f"SELECT match_id, steam64_id FROM match_history WHERE match_id IN ({', '.join('?' * len(chunk))})",
+            chunk
+        ))
+    return [
+        row for match in matches for row in match.rows
+        if match.finished_at >= cutoff or (row[0], row[1]) in kept
+    ]
+
+async def reindex_matches(chunk: int = 2000, progress=None) -> tuple[int, int]:
+    """
+    Derive match_history again from match_archive, for every archived match.
+    Rows are upserted in place, then rollups and trend state are rebuilt.
+    Lobby rows that retention already deleted stay deleted.
+    Decoding the next chunk overlaps with writing the previous one.
+    `progress(matches, rows)` is called after every chunk. Returns the totals.
+    """
+    db = get_db()
+    matches = rows = 0
+    last_rowid = 0
+    pending = None
+    cutoff = int(await get_state("retention_cutoff") or 0)
+
+    async def fetch():
+        return await db.fetchall(
+            "SELECT rowid, match_id, sha256, codec, data FROM match_archive WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last_rowid, chunk)
         )
-        await db.commit()
-
-async def insert_match(match: dict):
-    async with aiosqlite.connect(DB_FILE) as db:
-        match_id = match["id"]
-        finished_at = iso_to_unix(match["finished_at"])
-        data_source = match["data_source"]
-        data_source_match_id = match.get("data_source_match_id")
-        map_name = match["map_name"]
-        has_banned_player = int(match["has_banned_player"])
-
-        # Build team score lookup
-        team_scores = {
-            team["team_number"]: team["score"]
-            for team in match.get("team_scores", [])
-        }
-
-        rows = []
-
-        for p in match["stats"]:
-            steam64_id = p["steam64_id"]
-            initial_team = p.get("initial_team_number")
-
-            team_score = team_scores.get(initial_team)
-            enemy_score = None
-            win = None
-
-            if team_score is not None and len(team_scores) == 2:
-                enemy_score = next(
-                    score for team, score in team_scores.items()
-                    if team != initial_team
-                )
-                win = int(team_score > enemy_score)
-
-            rows.append((
-                match_id,
-                steam64_id,
-                finished_at,
-                data_source,
-                data_source_match_id,
-                map_name,
-                has_banned_player,
-
-                initial_team,
-                team_score,
-                enemy_score,
-                win,
-
-                p.get("name"),
-
-                p.get("total_kills"),
-                p.get("total_deaths"),
-                p.get("total_assists"),
-                p.get("total_hs_kills"),
-                p.get("kd_ratio"),
-                p.get("mvps"),
-                p.get("score"),
-
-                p.get("total_damage"),
-                p.get("dpr"),
-                p.get("rounds_count"),
-                p.get("rounds_survived"),
-                p.get("rounds_survived_percentage"),
-                p.get("rounds_won"),
-                p.get("rounds_lost"),
-
-                p.get("accuracy"),
-                p.get("accuracy_enemy_spotted"),
-                p.get("accuracy_head"),
-                p.get("spray_accuracy"),
-                p.get("preaim"),
-                p.get("reaction_time"),
-
-                p.get("shots_fired"),
-                p.get("shots_fired_enemy_spotted"),
-                p.get("shots_hit_foe"),
-                p.get("shots_hit_foe_head"),
-                p.get("shots_hit_friend"),
-                p.get("shots_hit_friend_head"),
-
-                p.get("utility_on_death_avg"),
-                p.get("he_thrown"),
-                p.get("he_foes_damage_avg"),
-                p.get("he_friends_damage_avg"),
-                p.get("molotov_thrown"),
-                p.get("smoke_thrown"),
-                p.get("flashbang_thrown"),
-                p.get("flashbang_hit_foe"),
-                p.get("flashbang_hit_friend"),
-                p.get("flashbang_leading_to_kill"),
-                p.get("flashbang_hit_foe_avg_duration"),
-                p.get("flash_assist"),
-
-                p.get("counter_strafing_shots_all"),
-                p.get("counter_strafing_shots_good"),
-                p.get("counter_strafing_shots_bad"),
-                p.get("counter_strafing_shots_good_ratio"),
-
-                p.get("trade_kill_opportunities"),
-                p.get("trade_kill_attempts"),
-                p.get("trade_kills_succeed"),
-                p.get("trade_kill_attempts_percentage"),
-                p.get("trade_kills_success_percentage"),
-                p.get("trade_kill_opportunities_per_round"),
-
-                p.get("traded_death_opportunities"),
-                p.get("traded_death_attempts"),
-                p.get("traded_deaths_succeed"),
-                p.get("traded_death_attempts_percentage"),
-                p.get("traded_deaths_success_percentage"),
-                p.get("traded_deaths_opportunities_per_round"),
-
-                p.get("multi1k"),
-                p.get("multi2k"),
-                p.get("multi3k"),
-                p.get("multi4k"),
-                p.get("multi5k"),
-
-                p.get("leetify_rating"),
-                p.get("ct_leetify_rating"),
-                p.get("t_leetify_rating"),
-            ))
 
-        await db.executemany("""
-            INSERT OR REPLACE INTO match_history (
-                match_id,
-                steam64_id,
-                finished_at,
-                data_source,
-                data_source_match_id,
-                map_name,
-                has_banned_player,
-
-                initial_team_number,
-                team_score,
-                enemy_team_score,
-                win,
-
-                name,
-
-                total_kills,
-                total_deaths,
-                total_assists,
-                total_hs_kills,
-                kd_ratio,
-                mvps,
-                score,
-
-                total_damage,
-                dpr,
-                rounds_count,
-                rounds_survived,
-                rounds_survived_percentage,
-                rounds_won,
-                rounds_lost,
-
-                accuracy,
-                accuracy_enemy_spotted,
-                accuracy_head,
-                spray_accuracy,
-                preaim,
-                reaction_time,
-
-                shots_fired,
-                shots_fired_enemy_spotted,
-                shots_hit_foe,
-                shots_hit_foe_head,
-                shots_hit_friend,
-                shots_hit_friend_head,
-
-                utility_on_death_avg,
-                he_thrown,
-                he_foes_damage_avg,
-                he_friends_damage_avg,
-                molotov_thrown,
-                smoke_thrown,
-                flashbang_thrown,
-                flashbang_hit_foe,
-                flashbang_hit_friend,
-                flashbang_leading_to_kill,
-                flashbang_hit_foe_avg_duration,
-                flash_assist,
-
-                counter_strafing_shots_all,
-                counter_strafing_shots_good,
-                counter_strafing_shots_bad,
-                counter_strafing_shots_good_ratio,
-
-                trade_kill_opportunities,
-                trade_kill_attempts,
-                trade_kills_succeed,
-                trade_kill_attempts_percentage,
-                trade_kills_success_percentage,
-                trade_kill_opportunities_per_round,
-
-                traded_death_opportunities,
-                traded_death_attempts,
-                traded_deaths_succeed,
-                traded_death_attempts_percentage,
-                traded_deaths_success_percentage,
-                traded_deaths_opportunities_per_round,
-
-                multi1k,
-                multi2k,
-                multi3k,
-                multi4k,
-                multi5k,
-
-                leetify_rating,
-                ct_leetify_rating,
-                t_leetify_rating
-            ) 
-            VALUES (
-                ?, ?, ?, ?, ?, ?, ?,
-                ?, ?, ?, ?,
-                ?,
-                ?, ?, ?, ?, ?, ?, ?,
-                ?, ?, ?, ?, ?, ?, ?,
-                ?, ?, ?, ?, ?, ?,
-                ?, ?, ?, ?, ?, ?,
-                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                ?, ?, ?, ?,
-                ?, ?, ?, ?, ?, ?,
-                ?, ?, ?, ?, ?, ?,
-                ?, ?, ?, ?, ?,
-                ?, ?, ?
+    while batch := await fetch():
+        last_rowid = batch[-1][0]
+        parsed = _reparse(batch)
+        values = await _retained_rows(parsed, cutoff)
+
+        async def job(conn, values=values):
+            await conn.executemany(REINDEX_MATCH_SQL, values)
+
+        if pending is not None:
+            await pending
+        pending = asyncio.ensure_future(db.write(job))
+        matches += len(parsed)
+        rows += len(values)
+        if progress:
+            progress(matches, rows)
+    if pending is not None:
+        await pending
+
+    async def rebuild(conn):
+        await rebuild_rollups(conn)
+        async with conn.execute("SELECT steam64_id FROM tracked_players") as cursor:
+            for (steam64_id,) in await cursor.fetchall():
+                await rebuild_trend(conn, steam64_id)
+
+    await db.write(rebuild)
+    global _generation
+    _generation += 1
+    return matches, rows
+
+# ====== MAINTENANCE ======
+# Used by utils/maintenance.py. Deletes run in batches, each its own
+# transaction, so polls and posts keep going in between.
+
+async def prune_lobby_rows(before: int, batch: int = 2000) -> int:
+    """
+    Delete match_history rows of players nobody tracks that finished before
+    `before`. Their totals are added to the player's player_pruned_totals
+    row and taken out of the rollup tables, whose emptied rows go too.
+    Tracked players keep their full history. Returns the number of rows
+    deleted.
+    """
+    async def job(db):
+        async with db.execute("""
+            SELECT rowid FROM match_history
+            WHERE finished_at < ? AND steam64_id NOT IN (SELECT steam64_id FROM tracked_players)
+            LIMIT ?
+        """, (before, batch)) as cursor:
+            rowids = [row[0] for row in await cursor.fetchall()]
+        for chunk in _chunks(rowids):
+            where = f"rowid IN ({', '.join('?' * len(chunk))})"
+            await db.execute(f"""
+                INSERT INTO player_pruned_totals
+                SELECT steam64_id, {", ".join(ROLLUP_COLUMNS)} FROM ({_rollup_select("NULL", where)}) WHERE true
+                ON CONFLICT (steam64_id) DO UPDATE SET
+                    {", ".join(f"{c} = {c} + excluded.{c}" for c in ROLLUP_COLUMNS)}
+            """, chunk)
+            for table, key, expr in ROLLUPS:
+                await db.execute(_unrollup_sql(table, key, expr, where), chunk)
+                await db.execute(f"""
+                    DELETE FROM {table}
+                    WHERE steam64_id IN (SELECT steam64_id FROM match_history WHERE {where}) AND matches <= 0
+                """, chunk)
+            await db.execute(f"DELETE FROM match_history WHERE {where}", chunk)
+        return len(rowids)
+
+    # reindex_matches leaves rows older than this alone
+    await set_state("retention_cutoff", str(max(before, int(await get_state("retention_cutoff") or 0))))
+    deleted = 0
+    while count := await get_db().write(job):
+        deleted += count
+        if count < batch:
+            break
+    if deleted:
+        global _generation
+        _generation += 1
+    return deleted
+
+async def prune_logs(before: int) -> int:
+    """Delete ingest_log entries and finished outbox rows older than `before`."""
+    async def job(db):
+        logs = await db.execute("DELETE FROM ingest_log WHERE logged_at < ?", (before,))
+        posts = await db.execute("DELETE FROM outbox WHERE status != 'pending' AND created_at < ?", (before,))
+        return logs.rowcount + posts.rowcount
+    return await get_db().write(job)
+
+async def prune_archive(batch: int = 2000) -> int:
+    """Delete archived payloads of matches that have no match_history rows left."""
+    async def job(db):
+        cursor = await db.execute("""
+            DELETE FROM match_archive WHERE rowid IN (
+                SELECT rowid FROM match_archive
+                WHERE match_id NOT IN (SELECT match_id FROM match_history)
+                LIMIT ?
             )
-        """, rows)
+        """, (batch,))
+        return cursor.rowcount
+
+    deleted = 0
+    while count := await get_db().write(job):
+        deleted += count
+        if count < batch:
+            break
+    return deleted
+
+async def incremental_vacuum(pages: int = 4096) -> tuple[int, int]:
+    """
+    Give free pages back to the file system, `pages` at a time so queued
+    writes get in between. Only databases created with auto_vacuum =
+    INCREMENTAL can do this, older ones need one full VACUUM first
+    (vacuum_full). Returns freelist_count before and after.
+    """
+    async def free_pages(db) -> int:
+        async with db.execute("PRAGMA freelist_count") as cursor:
+            return (await cursor.fetchone())[0]
+
+    async def job(db):
+        async with db.execute("PRAGMA auto_vacuum") as cursor:
+            if (await cursor.fetchone())[0] != 2:
+                return None
+        # sqlite3 steps a statement that returns no rows only once, which for
+        # this pragma frees a single page. executescript runs it to the end.
+        await db.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        return await free_pages(db)
+
+    async with get_db().read() as db:
+        before = remaining = await free_pages(db)
+    while remaining:
+        count = await get_db().write(job, transaction=False)
+        if count is None or count >= remaining:
+            break
+        remaining = count
+    return before, remaining
+
+async def vacuum_full():
+    """
+    Rewrite the whole file, which also applies auto_vacuum=INCREMENTAL from
+    PRAGMAS to databases created before it. Blocks writes while it runs.
+    """
+    async def job(db):
+        await db.execute("VACUUM")
+    await get_db().write(job, transaction=False)
+
+async def analyze(limit: int = 1000):
+    """Refresh planner statistics, sampling about `limit` rows per index."""
+    async def job(db):
+        await db.execute(f"PRAGMA analysis_limit = {int(limit)}")
+        await db.execute("ANALYZE")
+        await db.execute("PRAGMA optimize")
+    await get_db().write(job)
+
+async def checkpoint() -> tuple[int, int, int]:
+    """Copy the WAL into the database and truncate it. (busy, wal pages, pages copied)."""
+    async def job(db):
+        async with db.execute("PRAGMA wal_checkpoint(TRUNCATE)") as cursor:
+            return tuple(await cursor.fetchone())
+    return await get_db().write(job, transaction=False)
 
-        await db.commit()
+async def get_size_report() -> dict:
+    """Database and WAL size, free pages and what the rows are spent on."""
+    db = get_db()
+    (page_size,), (page_count,), (freelist,), (auto_vacuum,) = [
+        await db.fetchone(f"PRAGMA {pragma}") for pragma in ("page_size", "page_count", "freelist_count", "auto_vacuum")
+    ]
+    wal = f"{db.path}-wal"
+    report = {
+        "file_bytes": os.path.getsize(db.path),
+        "wal_bytes": os.path.getsize(wal) if os.path.exists(wal) else 0,
+        "page_size": page_size,
+        "pages": page_count,
+        "free_pages": freelist,
+        "auto_vacuum": ("none", "full", "incremental")[auto_vacuum],
+        "match_rows": (await db.fetchone("SELECT COUNT(*) FROM match_history"))[0],
+        "tracked_rows": (await db.fetchone(
+            "SELECT COUNT(*) FROM match_history WHERE steam64_id IN (SELECT steam64_id FROM tracked_players)"
+        ))[0],
+        "archived_matches": (await db.fetchone("SELECT COUNT(*) FROM match_archive"))[0],
+    }
+    try:
+        # Only when SQLite was built with the dbstat table
+        rows = await db.fetchall("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC")
+        report["objects"] = dict(rows)
+    except aiosqlite.OperationalError:
+        pass
+    return report
 
+def _plan_checks() -> list[tuple[str, str, tuple | dict, tuple[str, ...]]]:
+    """(name, query, parameters, indexes the plan may use) for the hot read paths."""
+    player = "0"
+    leaderboard = {"last": 20, "min_matches": 5, "limit": 10, "guild_id": 0}
+    # Both start with (steam64_id, finished_at DESC), the planner may pick either
+    by_player = ("idx_match_history_steam_time", "idx_match_history_leaderboard")
+    return [
+        ("history page", f"""
+            SELECT rowid, {", ".join(MatchSummary.__slots__)} FROM match_history
+            WHERE steam64_id = ? AND finished_at <= ? AND (finished_at < ? OR rowid > ?)
+            ORDER BY finished_at DESC, rowid LIMIT ?
+        """, (player, 0, 0, 0, 11), by_player),
+        ("history weekly",
+         "SELECT * FROM player_weekly_stats WHERE steam64_id = ? AND week >= ? ORDER BY week DESC LIMIT ?",
+         (player, "2000-01-03", 8), ("sqlite_autoindex_player_weekly_stats_1",)),
+        ("leaderboard tracked", _leaderboard_sql("tracked").format(metric="rating"), leaderboard,
+         ("COVERING INDEX idx_match_history_leaderboard",)),
+        ("leaderboard all", _leaderboard_sql("all").format(metric="rating"), leaderboard,
+         ("COVERING INDEX idx_match_history_leaderboard",)),
+        ("compare summary", f"""
+            SELECT {", ".join(LEADERBOARD_COLUMNS)} FROM match_history
+            WHERE steam64_id = ? ORDER BY finished_at DESC LIMIT ?
+        """, (player, 20), ("COVERING INDEX idx_match_history_leaderboard",)),
+        ("export player", f"""
+            SELECT {", ".join(COLUMNS)} FROM match_history
+            WHERE steam64_id = ? ORDER BY steam64_id, finished_at DESC
+        """, (player,), by_player),
+        ("export guild", f"""
+            SELECT {", ".join(COLUMNS)} FROM match_history
+            WHERE {GUILD_ROSTER_SQL.format("?")} ORDER BY steam64_id, finished_at DESC
+        """, (0,), by_player),
+        ("export all", f"SELECT {', '.join(COLUMNS)} FROM match_history ORDER BY steam64_id, finished_at DESC",
+         (), by_player),
+        ("known matches", "SELECT DISTINCT match_id FROM match_history WHERE match_id IN (?, ?)",
+         ("a", "b"), ("sqlite_autoindex_match_history_1",)),
+    ]
 
-def iso_to_unix(ts: str) -> int:
-    return int(datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp())
+async def check_query_plans() -> list[dict]:
+    """
+    EXPLAIN QUERY PLAN for every query in _plan_checks. `ok` is False when
+    the plan uses none of the expected indexes, e.g. after ANALYZE steered
+    the planner elsewhere or an index went missing.
+    """
+    results = []
+    async with get_db().read() as db:
+        for name, sql, params, expected in _plan_checks():
+            async with db.execute(f"EXPLAIN QUERY PLAN {sql}", params) as cursor:
+                plan = [row[3] for row in await cursor.fetchall()]
+            ok = any(index in step for step in plan for index in expected)
+            results.append({"name": name, "ok": ok, "plan": plan})
+    return results
@@ -0,0 +1,63 @@
+"""
+Export helper
+
+Streams match_history as gzip compressed CSV or NDJSON. Rows are encoded
+and compressed one database chunk at a time, so memory use does not grow
+with the table. Output can be cut into parts of at most `part_size` bytes,
+each a complete gzip file (CSV parts repeat the header).
+"""
+
+import csv
+import io
+import json
+import zlib
+
+from utils.database import COLUMNS, iter_match_history
+
+FORMATS = ("csv", "ndjson")
+
+# zlib holds back some compressed output until the stream is finished, so a
+# part is closed this far below the limit
+PART_MARGIN = 256 * 1024
+
+def encode_rows(rows: list[tuple], fmt: str, header: bool = False) -> bytes:
+    if fmt == "ndjson":
+        return "".join(json.dumps(dict(zip(COLUMNS, row))) + "\n" for row in rows).encode()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+def _gzip():
+    return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 writes a gzip header and trailer
+
+async def iter_export(fmt: str = "csv", part_size: int | None = None, chunk: int = 1000, **filters):
+    """
+    Yield (part, data) pairs of compressed bytes, part counting from 1.
+    `filters` are passed to iter_match_history.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}")
+    limit = max(part_size - PART_MARGIN, part_size // 2) if part_size else None
+
+    part, written, compressor = 1, 0, _gzip()
+    header = True
+    async for rows in iter_match_history(chunk=chunk, **filters):
+        if limit and written >= limit:
+            yield part, compressor.flush()
+            part, written, compressor = part + 1, 0, _gzip()
+            header = True
+        data = compressor.compress(encode_rows(rows, fmt, header))
+        header = False
+        written += len(data)
+        if data:
+            yield part, data
+    tail = encode_rows([], fmt, header)
+    yield part, compressor.compress(tail) + compressor.flush()
+
+def part_filename(fmt: str, part: int, single: bool, stem: str = "match_history") -> str:
+    if single:
+        return f"{stem}.{fmt}.gz"
+    return f"{stem}.part{part}.{fmt}.gz"
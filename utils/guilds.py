@@ -0,0 +1,65 @@
+"""
+Guild config helper
+
+Every guild's announce channel, followed players and compiled alert rules,
+loaded from the database in one go and kept in memory until a config write
+bumps the config generation.
+"""
+
+import logging
+
+from utils.alerts import Rule
+from utils.cache import GenerationCache
+from utils.database import get_config_generation, get_guild_config_rows
+
+log = logging.getLogger(__name__)
+
+class GuildConfig:
+    __slots__ = ("guild_id", "channel_id", "players", "rules")
+
+    def __init__(self, guild_id: int, channel_id: int | None = None, players: list[str] | None = None,
+                 rules: list[Rule] | None = None):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.players = players or []
+        self.rules = rules or []
+
+_cache = GenerationCache(get_config_generation, maxsize=1)
+
+async def _load() -> dict[int, GuildConfig]:
+    config_rows, player_rows, rule_rows = await get_guild_config_rows()
+    configs = {guild_id: GuildConfig(guild_id, channel_id) for guild_id, channel_id in config_rows}
+    for guild_id, steam64_id in player_rows:
+        configs.setdefault(guild_id, GuildConfig(guild_id)).players.append(steam64_id)
+    for row in rule_rows:
+        try:
+            rule = Rule(*row)
+        except ValueError as e:
+            log.warning("skipping alert rule", extra={"rule_id": row[0], "error": str(e)})
+            continue
+        configs.setdefault(rule.guild_id, GuildConfig(rule.guild_id)).rules.append(rule)
+    return configs
+
+async def get_configs() -> dict[int, GuildConfig]:
+    return await _cache.get("configs", _load)
+
+async def get_config(guild_id: int) -> GuildConfig | None:
+    return (await get_configs()).get(guild_id)
+
+async def get_channels_by_player() -> dict[str, list[int]]:
+    """Announce channels per followed player, for fanning out one fetch."""
+    channels: dict[str, list[int]] = {}
+    for config in (await get_configs()).values():
+        if config.channel_id is None:
+            continue
+        for steam64_id in config.players:
+            channels.setdefault(steam64_id, []).append(config.channel_id)
+    return channels
+
+async def get_rules_by_channel() -> dict[int, list[Rule]]:
+    """Alert rules of each announce channel's guild."""
+    return {
+        config.channel_id: config.rules
+        for config in (await get_configs()).values()
+        if config.channel_id is not None and config.rules
+    }
@@ -2,70 +2,77 @@
 Leetify helper
 """
 
-from datetime import datetime
-from pathlib import Path
-import aiohttp
+import logging
+from datetime import datetime, timezone
 import discord
-from utils.database import get_last_match_id, set_last_match_id, insert_match
+from utils.assets import scorecard_file
+from utils.client import LeetifyClient
+from utils.alerts import evaluate
+from utils.database import get_last_match_id, ingest_matches, enqueue_posts
+from utils.guilds import get_rules_by_channel
+from utils.records import Match, PlayerRow
 from utils.strings import get_random_string
+from utils.trends import Trend
+from utils.analytics import ENGINE
 
-URL = "https://api-public.cs-prod.leetify.com"
+log = logging.getLogger(__name__)
 
-async def fetch_latest_matches(steamid: str, token: str):
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/json",
-    }
-    params = { "steam64_id": steamid }
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.get(f"{URL}/v3/profile/matches", params=params) as r:
-            r.raise_for_status()
-            matches = await r.json()
+async def fetch_latest_matches(steamid: str, client: LeetifyClient):
+    matches = await client.get_matches(steamid)
 
-        if not matches:
-            print("No matches found")
-            return
+    if not matches:
+        log.info("no matches found", extra={"steam64": steamid})
+        return
 
     return matches
 
-async def process_matches(matches: dict, channel, steamid: str, token: str):
-    for match in matches:
-        await insert_match(match)
-
-    latest_match = matches[0]
-    latest_match_id = latest_match["id"]
-
-    last_match_id = await get_last_match_id()
-    if latest_match_id == last_match_id:
+async def process_matches(matches: list[Match], steamid: str, channel_ids: list[int], client: LeetifyClient):
+    """
+    Store the matches and queue a post in each channel for every match newer
+    than the player's cursor, oldest first, with the alerts each channel's
+    rules raise for it. Sending is left to the outbox worker.
+    """
+    inserted, skipped = await ingest_matches(matches, steamid)
+    log.info("ingested matches", extra={"steam64": steamid, "inserted": inserted, "skipped": skipped})
+    if inserted:
+        await ENGINE.refresh()
+
+    last_match_id = await get_last_match_id(steamid)
+    unposted = []
+    for match in sorted(matches, key=lambda m: m.finished_at, reverse=True):
+        if match.id == last_match_id:
+            break
+        unposted.append(match)
+
+    if last_match_id is None:
+        # First poll for this player: announce the latest match, not their whole history
+        unposted = unposted[:1]
+    if not unposted:
         return  # already posted
 
-    # This should probably be made its own function.
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/json",
-    }
-    params = { "steam64_id": steamid }
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.get(f"{URL}/v3/profile", params=params) as resp:
-            if resp.status != 200:
-                return
-            profile_data = await resp.json()
-
-    # Profile stats
-    winrate = profile_data["winrate"]
-    premier_rank = profile_data["ranks"]["premier"]
-    faceit_rank = profile_data["ranks"]["faceit"]
-    leetify_rank = profile_data["ranks"]["leetify"]
-
+    # A new match changes winrate and maybe ranks
+    client.profiles.invalidate(steamid)
+    unposted.reverse()
+    rules = await get_rules_by_channel()
+    alerts = await evaluate(steamid, unposted, {channel_id: rules.get(channel_id, []) for channel_id in channel_ids})
+    await enqueue_posts(steamid, channel_ids, unposted, alerts)
+    log.info("queued posts", extra={"steam64": steamid, "count": len(unposted), "channels": len(channel_ids)})
+
+async def build_match_embed(row: PlayerRow, profile_data: dict | None, trend: Trend | None = None,
+                            alerts: list[str] | None = None, percentiles: dict | None = None
+                            ) -> tuple[discord.Embed, list[discord.File]]:
+    """
+    Embed and attachments for one player's match_history row. Without
+    `profile_data` (Leetify down) the profile fields are left out.
+    """
     # Match stats
-    stats = latest_match["stats"][0]
-    rating: float = stats["leetify_rating"]
-    total_kills = stats["total_kills"]
-    total_deaths = stats["total_deaths"]
-    kd_ratio = stats["kd_ratio"]
-    mvps = stats["mvps"]
-    total_assists = stats["total_assists"]
-    total_damage = stats["total_damage"]
+    rating: float = row["leetify_rating"]
+    total_kills = row["total_kills"]
+    total_deaths = row["total_deaths"]
+    kd_ratio = row["kd_ratio"]
+    mvps = row["mvps"]
+    total_assists = row["total_assists"]
+    total_damage = row["total_damage"]
 
     if rating > 1.5:
         color = discord.Color.green()
@@ -77,11 +84,14 @@ async def process_matches(matches: dict, channel, steamid: str, token: str):
         color = discord.Color.red()
         message = get_random_string("BRUTAL")
 
+    if alerts:
+        message = "\n".join([message, *alerts])
+
     embed = discord.Embed(
         title="📊 Post-Anton-Match Analysis",
         description=message,
         color=color,
-        timestamp=datetime.strptime(latest_match["finished_at"], "%Y-%m-%dT%H:%M:%S.%fZ")
+        timestamp=datetime.fromtimestamp(row["finished_at"], tz=timezone.utc)
     )
 
     embed.add_field(name="\u200B", value="**Match Stats:**", inline=False)
@@ -92,48 +102,64 @@ async def process_matches(matches: dict, channel, steamid: str, token: str):
     embed.add_field(name="🤝 Assists", value=f"┗ ` {total_assists} `", inline=True)
     embed.add_field(name="🥊 Damage", value=f"┗ ` {total_damage} `", inline=True)
 
-    embed.add_field(name="\u200B", value="**Post-Match Stats:**", inline=False)
-    embed.add_field(name=f"Win Rate - {winrate*100}%", value=f"{progress_bar(winrate)}", inline=False)
-    embed.add_field(name="Premier Rank", value=f"┗ ` {premier_rank} `", inline=True)
-    embed.add_field(name="Faceit Rank", value=f"┗ ` {faceit_rank} `", inline=True)
-    embed.add_field(name="Leetify Rating", value=f"┗ ` {leetify_rank} `", inline=True)
-
-    team_scores = latest_match["team_scores"]
-    initial_team = stats["initial_team_number"]
-    scores = {team["team_number"]: team["score"] for team in team_scores}
-
-    score = scores[initial_team]
-    opponent_scores = [score for team, score in scores.items() if team != initial_team]
-    opponent_score = max(opponent_scores)
-
-    if score > opponent_score:
+    if profile_data is not None:
+        winrate = profile_data["winrate"]
+        ranks = profile_data["ranks"]
+        embed.add_field(name="\u200B", value="**Post-Match Stats:**", inline=False)
+        embed.add_field(name=f"Win Rate - {winrate*100}%", value=f"{progress_bar(winrate)}", inline=False)
+        embed.add_field(name="Premier Rank", value=f"┗ ` {ranks['premier']} `", inline=True)
+        embed.add_field(name="Faceit Rank", value=f"┗ ` {ranks['faceit']} `", inline=True)
+        embed.add_field(name="Leetify Rating", value=f"┗ ` {ranks['leetify']} `", inline=True)
+
+    if trend is not None:
+        embed.add_field(name="\u200B", value="**Form:**", inline=False)
+        embed.add_field(name="🔥 Streak", value=f"┗ ` {trend.streak_text()} `", inline=True)
+        embed.add_field(name="📉 Rating EWMA", value=f"┗ ` {format_rating(trend.ewma_rating)} `", inline=True)
+        embed.add_field(
+            name="📊 Avg 10 / 50",
+            value=f"┗ ` {format_rating(trend.rolling_average(10))} / {format_rating(trend.rolling_average(50))} `",
+            inline=True
+        )
+
+    if percentiles:
+        embed.add_field(name="\u200B", value="**Percentile (own history / lobby):**", inline=False)
+        for name, column in PERCENTILE_FIELDS:
+            own, lobby = percentiles[column]
+            embed.add_field(name=name, value=f"┗ ` {format_percentile(own)} / {format_percentile(lobby)} `", inline=True)
+
+    score = row["team_score"]
+    opponent_score = row["enemy_team_score"]
+
+    if score is None or opponent_score is None or score == opponent_score:
+        result = "tie"
+    elif score > opponent_score:
         result = "win"
-    elif score < opponent_score:
-        result = "loss"
     else:
-        result = "tie"
-
-    result_image = Path("assets/match") / f"{result}.png"
-    result_file = discord.File(result_image, filename="result_image.png")
-    embed.set_image(url="attachment://result_image.png")
-
-    map_image = get_map_image(latest_match["map_name"])
-    map_file = discord.File(map_image, filename="map_image.png")
-    embed.set_footer(
-        text=f"{latest_match["map_name"]} - {latest_match["team_scores"][0]["score"]}:{latest_match["team_scores"][1]["score"]}",
-        icon_url="attachment://map_image.png"
-    )
-
-    await channel.send(files=[result_file, map_file], embed=embed)
-
-    await set_last_match_id(latest_match_id)
-
-IMAGE_DIR = Path("assets/maps")
-FALLBACK_IMAGE = IMAGE_DIR / "misc.png"
+        result = "loss"
 
-def get_map_image(map_name: str) -> Path:
-    image_path = IMAGE_DIR / f"{map_name}.png"
-    return image_path if image_path.exists() else FALLBACK_IMAGE
+    # One composited image instead of separate banner and map icon uploads
+    scorecard = await scorecard_file(row["map_name"], result, score, opponent_score)
+    embed.set_image(url=f"attachment://{scorecard.filename}")
+    embed.set_footer(text=f"{row["map_name"]} - {score}:{opponent_score}")
+
+    return embed, [scorecard]
+
+# Percentiles are only computed for these, keep STAT_COLUMNS in utils/analytics.py in step
+PERCENTILE_FIELDS = (
+    ("💀 Kills", "total_kills"),
+    ("🎯 K/D", "kd_ratio"),
+    ("🥊 Damage", "total_damage"),
+    ("📈 Rating", "leetify_rating"),
+    ("🔫 Accuracy", "accuracy"),
+    ("🤝 Trades", "trade_kills_success_percentage"),
+)
+
+def format_percentile(value: float) -> str:
+    return "n/a" if value != value else f"p{value:.0f}"  # NaN check
+
+def format_rating(rating: float | None) -> str:
+    """Leetify ratings are stored as fractions and shown like the site does."""
+    return f"{rating * 100:+.2f}" if rating is not None else "n/a"
 
 def progress_bar(winrate, width=45):
     winrate = max(0, min(winrate, 1))
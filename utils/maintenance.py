@@ -0,0 +1,88 @@
+"""
+Maintenance helper
+
+Keeps the database from only growing. Rows of lobby players nobody tracks
+are deleted once they are older than the retention window, collapsed into
+one player_pruned_totals row per player, and taken out of the rollup
+tables along with them. Tracked players keep their full history. Freed pages go back to the file system via incremental vacuum,
+planner statistics are refreshed and the WAL is truncated. Each run
+reports the database size and the query-plan checks before and after.
+"""
+
+import logging
+import time
+
+from utils.database import (
+    analyze, check_query_plans, checkpoint, get_size_report, incremental_vacuum,
+    prune_archive, prune_lobby_rows, prune_logs,
+)
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = 180
+
+async def report() -> dict:
+    return {"size": await get_size_report(), "plans": await check_query_plans()}
+
+async def run_maintenance(retention_days: int | None = DEFAULT_RETENTION_DAYS) -> dict:
+    """One maintenance pass. `retention_days` None or 0 keeps every row."""
+    start = time.perf_counter()
+    before = await report()
+
+    pruned = {"rows": 0, "logs": 0, "payloads": 0}
+    if retention_days:
+        cutoff = int(time.time()) - retention_days * 86400
+        pruned["rows"] = await prune_lobby_rows(cutoff)
+        pruned["logs"] = await prune_logs(cutoff)
+        pruned["payloads"] = await prune_archive()
+    free_before, free_after = await incremental_vacuum()
+    freed = free_before - free_after
+    await analyze()
+    await checkpoint()
+
+    after = await report()
+    result = {
+        "before": before, "after": after, "pruned": pruned,
+        "free_pages": (free_before, free_after), "freed_pages": freed,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+    log.info("maintenance finished", extra={
+        "pruned": pruned, "freed_pages": freed, "free_pages_before": free_before, "free_pages_after": free_after,
+        "seconds": result["seconds"],
+        "bytes_before": before["size"]["file_bytes"] + before["size"]["wal_bytes"],
+        "bytes_after": after["size"]["file_bytes"] + after["size"]["wal_bytes"],
+    })
+    if after["size"]["auto_vacuum"] != "incremental" and after["size"]["free_pages"]:
+        log.warning("database cannot shrink incrementally, run `python cli.py maintain --vacuum` once", extra={
+            "free_pages": after["size"]["free_pages"],
+        })
+    for check in after["plans"]:
+        if not check["ok"]:
+            log.warning("query plan check failed", extra={"query": check["name"], "plan": check["plan"]})
+    return result
+
+def format_report(result: dict) -> list[str]:
+    """Lines for the CLI: size before -> after, then each plan check."""
+    before, after = result["before"]["size"], result["after"]["size"]
+
+    def mib(size: dict) -> str:
+        return f"{(size['file_bytes'] + size['wal_bytes']) / 2**20:.1f} MiB"
+
+    free_before, free_after = result["free_pages"]
+    lines = [
+        f"Size: {mib(before)} -> {mib(after)} (auto_vacuum {after['auto_vacuum']})",
+        f"Rows: {before['match_rows']} -> {after['match_rows']} ({after['tracked_rows']} tracked),"
+        f" archived matches {before['archived_matches']} -> {after['archived_matches']}",
+        f"Pruned: {result['pruned']['rows']} lobby rows, {result['pruned']['logs']} log rows,"
+        f" {result['pruned']['payloads']} payloads; free pages {free_before} -> {free_after} in {result['seconds']}s",
+    ]
+    for name, size in sorted(after.get("objects", {}).items(), key=lambda item: -item[1])[:8]:
+        lines.append(f"  {name:<40} {size / 2**20:8.1f} MiB")
+    for check_before, check_after in zip(result["before"]["plans"], result["after"]["plans"]):
+        status = "ok" if check_after["ok"] else "CHECK"
+        changed = "" if check_before["plan"] == check_after["plan"] else " (plan changed)"
+        # Table and index steps only, not the CTE plumbing around them
+        steps = [step for step in check_after["plan"] if "INDEX" in step or step.startswith(("SCAN", "SEARCH"))
+                 and not step.startswith("SCAN (") and step.split()[1] not in ("recent", "totals")]
+        lines.append(f"  [{status}] {check_after['name']}{changed}: {' / '.join(steps)}")
+    return lines
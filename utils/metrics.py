@@ -0,0 +1,247 @@
+"""
+Metrics helper
+
+Counters, gauges and histograms kept in process and exposed in the
+Prometheus text format, plus the structured log setup.
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._children = {}
+
+    def labels(self, **labels):
+        key = tuple(sorted(labels.items()))
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """Yield (suffix, labels, value) for the exposition format."""
+        raise NotImplementedError
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0, **labels):
+        self.labels(**labels).inc(amount)
+
+    def total(self) -> float:
+        return sum(child.value for child in self._children.values())
+
+    def samples(self):
+        for labels, child in self._children.items():
+            yield "_total", labels, child.value
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, callback=None):
+        super().__init__(name, help)
+        self.callback = callback
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float, **labels):
+        self.labels(**labels).set(value)
+
+    def get(self, **labels) -> float:
+        if self.callback is not None and not labels:
+            return self.callback()
+        return self.labels(**labels).value
+
+    def samples(self):
+        if self.callback is not None:
+            yield "", (), self.callback()
+        for labels, child in self._children.items():
+            yield "", labels, child.value
+
+class _Buckets:
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = buckets
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float, **labels):
+        self.labels(**labels).observe(value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        for labels, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(child.bounds, child.counts):
+                cumulative += count
+                yield "_bucket", labels + (("le", bound),), cumulative
+            yield "_bucket", labels + (("le", "+Inf"),), child.count
+            yield "_sum", labels, child.sum
+            yield "_count", labels, child.count
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def _get(self, cls, name, help, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, **kwargs)
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str, callback=None) -> Gauge:
+        return self._get(Gauge, name, help, callback=callback)
+
+    def histogram(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_label_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Leetify API
+API_SECONDS = REGISTRY.histogram("leetify_request_seconds", "Leetify request latency including retries")
+API_ERRORS = REGISTRY.counter("leetify_errors", "Failed Leetify requests by kind")
+API_THROTTLED = REGISTRY.counter("leetify_throttled", "Leetify 429 responses")
+
+# Polling and ingestion
+POLL_SECONDS = REGISTRY.histogram("poll_player_seconds", "Fetch and process time per player")
+TICK_SECONDS = REGISTRY.histogram("poll_tick_seconds", "Time to poll the whole roster")
+INSERT_SECONDS = REGISTRY.histogram("db_insert_seconds", "insert_matches latency")
+ROWS_INSERTED = REGISTRY.counter("rows_inserted", "match_history rows inserted")
+ROWS_SKIPPED = REGISTRY.counter("rows_skipped", "match_history rows skipped as already stored")
+
+# Discord
+SEND_SECONDS = REGISTRY.histogram("discord_send_seconds", "channel.send latency")
+POSTS_SENT = REGISTRY.counter("posts_sent", "Match posts sent")
+
+LOOP_LAG = REGISTRY.gauge("event_loop_lag_seconds", "How late the event loop woke up a timer")
+STARTUP_SECONDS = REGISTRY.gauge("startup_seconds", "Seconds from process start until each startup stage finished")
+
+def track_db_size(path: str):
+    def size():
+        return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+    REGISTRY.gauge("db_size_bytes", "Database file size including WAL", callback=size)
+
+async def monitor_loop_lag(interval: float = 1.0):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.set(max(0.0, loop.time() - start - interval))
+
+async def start_metrics_server(port: int, host: str = "127.0.0.1") -> web.AppRunner:
+    """Serve REGISTRY on http://host:port/metrics."""
+    async def metrics(_request):
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; anything passed in `extra` becomes a field."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RESERVED})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def setup_logging(level: str = "INFO"):
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
@@ -0,0 +1,133 @@
+"""
+Outbox worker
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+
+import discord
+
+from utils.analytics import ENGINE
+from utils.client import LeetifyClient
+from utils.database import get_pending_posts, get_match_row, get_trend, mark_post_sent, mark_post_failed
+from utils.leetify import build_match_embed
+from utils.metrics import SEND_SECONDS, POSTS_SENT
+
+log = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 10
+
+# Failures that are not Discord's (the database, say) retry after this
+# without using up an attempt, so they never drop a post
+RETRY_LATER = 300
+
+def retry_delay(attempts: int) -> int:
+    """Seconds before the next try: 15s, 30s, 60s ... capped at an hour."""
+    return min(15 * 2 ** attempts, 3600)
+
+class OutboxWorker:
+    """
+    Sends queued match posts one at a time, oldest match first. A channel
+    whose oldest post is waiting for a retry is skipped until then, so each
+    channel still gets its posts in order. A post is only marked sent once
+    channel.send has returned, and Discord rate limits simply slow the
+    worker down instead of piling up in memory. A channel that is gone or
+    that the bot may not post in fails its posts at once, without retries.
+    Only Discord errors count toward MAX_ATTEMPTS. Without a Leetify profile
+    or percentiles the post goes out without those fields.
+    """
+
+    def __init__(self, get_channel, client: LeetifyClient, idle_interval: float = 30.0):
+        self.get_channel = get_channel
+        self.client = client
+        self.idle_interval = idle_interval
+        self._wake = asyncio.Event()
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Called after new posts were queued."""
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.drain()
+            except Exception:
+                log.exception("outbox drain failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.idle_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def drain(self) -> int:
+        """Send every post that is due now. Returns how many were sent."""
+        sent = 0
+        while True:
+            # The head post of every channel that is due, a failure pushes
+            # that channel's head into the future so the next round skips it
+            posts = await get_pending_posts(int(datetime.now().timestamp()))
+            if not posts:
+                return sent
+            for post_id, match_id, steamid, channel_id, attempts, _, alerts in posts:
+                if await self.send(post_id, match_id, steamid, channel_id, attempts, alerts):
+                    sent += 1
+
+    async def send(self, post_id: int, match_id: str, steamid: str, channel_id: int, attempts: int,
+                   alerts: list[str] | None = None) -> bool:
+        try:
+            row = await get_match_row(match_id, steamid)
+            if row is None:
+                raise LookupError(f"match {match_id} is not stored for {steamid}")
+            try:
+                profile_data = await self.client.get_cached_profile(steamid)
+            except Exception as e:
+                log.warning("profile lookup failed", extra={"steam64": steamid, "error": repr(e)})
+                profile_data = None
+            channel = await self.get_channel(channel_id)
+            try:
+                percentiles = await ENGINE.compare(row)
+            except Exception as e:
+                log.warning("percentiles failed", extra={"match_id": match_id, "error": repr(e)})
+                percentiles = None
+            embed, files = await build_match_embed(
+                row, profile_data, await get_trend(steamid), alerts, percentiles
+            )
+            with SEND_SECONDS.time():
+                await channel.send(files=files, embed=embed)
+        except Exception as e:
+            counted = isinstance(e, discord.DiscordException)
+            # Missing channels, permissions and match rows do not fix themselves
+            give_up = (
+                (counted and attempts + 1 >= MAX_ATTEMPTS)
+                or isinstance(e, (discord.Forbidden, discord.NotFound, LookupError))
+            )
+            delay = retry_delay(attempts) if counted else RETRY_LATER
+            await mark_post_failed(post_id, repr(e), int(datetime.now().timestamp()) + delay, give_up, counted)
+            log.warning("post failed", extra={
+                "post_id": post_id, "match_id": match_id, "steam64": steamid,
+                "attempts": attempts + counted, "gave_up": give_up, "error": repr(e),
+            })
+            return False
+
+        await mark_post_sent(post_id)
+        POSTS_SENT.inc()
+        return True
@@ -0,0 +1,39 @@
+"""
+Roster poller
+"""
+
+import asyncio
+import logging
+from utils.client import LeetifyClient
+from utils.leetify import fetch_latest_matches, process_matches
+from utils.metrics import POLL_SECONDS, TICK_SECONDS
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+
+async def poll_player(steamid: str, channel_ids: list[int], client: LeetifyClient, semaphore: asyncio.Semaphore):
+    with POLL_SECONDS.time():
+        async with semaphore:
+            matches = await fetch_latest_matches(steamid, client)
+        if matches:
+            await process_matches(matches, steamid, channel_ids, client)
+
+async def poll_roster(roster: dict[str, list[int]], client: LeetifyClient, concurrency: int = DEFAULT_CONCURRENCY):
+    """
+    Poll every tracked player at once, at most `concurrency` Leetify requests
+    in flight. `roster` maps each player to the channels following them, so a
+    player followed by several guilds is still fetched once. One failing
+    player never stops the rest of the roster.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    steamids = list(roster)
+    with TICK_SECONDS.time():
+        results = await asyncio.gather(
+            *(poll_player(steamid, roster[steamid], client, semaphore) for steamid in steamids),
+            return_exceptions=True
+        )
+
+    for steamid, result in zip(steamids, results):
+        if isinstance(result, Exception):
+            log.error("poll failed", extra={"steam64": steamid, "error": repr(result)})
@@ -0,0 +1,206 @@
+"""
+Match record helper
+
+Leetify match payloads are parsed once, straight into compact records: a
+Match holds one tuple per player in match_history column order, ready
+for the INSERT, and PlayerRow reads a stat out of such a tuple by name.
+Rows read back from the database use the same PlayerRow, so ingestion,
+embeds and alerts all see one shape. Each Match also carries its payload
+for the raw archive, re-encoded as compact JSON and compressed right away
+(utils/archive.py), so only the compressed bytes wait for the insert.
+"""
+
+import json
+from datetime import datetime
+
+from utils.archive import pack
+
+try:
+    import orjson
+    loads = orjson.loads
+    dumps = orjson.dumps
+except ImportError:
+    loads = json.loads
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+# match_history columns in table order: (name, SQL type). This one list
+# drives the DDL, the INSERT statement and row extraction. Match level and
+# team columns are filled from the match, every other column is read from
+# the player's stats entry under the same name, so adding a Leetify stat
+# is a one-line change here.
+FIELDS = (
+    ("match_id", "TEXT NOT NULL"),
+    ("steam64_id", "TEXT NOT NULL"),
+
+    ("finished_at", "INTEGER NOT NULL"),
+    ("data_source", "TEXT NOT NULL"),
+    ("data_source_match_id", "TEXT"),
+    ("map_name", "TEXT NOT NULL"),
+    ("has_banned_player", "INTEGER NOT NULL"),
+
+    ("initial_team_number", "INTEGER"),
+    ("team_score", "INTEGER"),
+    ("enemy_team_score", "INTEGER"),
+    ("win", "INTEGER"),
+
+    ("name", "TEXT"),
+
+    ("total_kills", "INTEGER"),
+    ("total_deaths", "INTEGER"),
+    ("total_assists", "INTEGER"),
+    ("total_hs_kills", "INTEGER"),
+    ("kd_ratio", "REAL"),
+    ("mvps", "INTEGER"),
+    ("score", "INTEGER"),
+
+    ("total_damage", "INTEGER"),
+    ("dpr", "REAL"),
+    ("rounds_count", "INTEGER"),
+    ("rounds_survived", "INTEGER"),
+    ("rounds_survived_percentage", "REAL"),
+    ("rounds_won", "INTEGER"),
+    ("rounds_lost", "INTEGER"),
+
+    ("accuracy", "REAL"),
+    ("accuracy_enemy_spotted", "REAL"),
+    ("accuracy_head", "REAL"),
+    ("spray_accuracy", "REAL"),
+    ("preaim", "REAL"),
+    ("reaction_time", "REAL"),
+
+    ("shots_fired", "INTEGER"),
+    ("shots_fired_enemy_spotted", "INTEGER"),
+    ("shots_hit_foe", "INTEGER"),
+    ("shots_hit_foe_head", "INTEGER"),
+    ("shots_hit_friend", "INTEGER"),
+    ("shots_hit_friend_head", "INTEGER"),
+
+    ("utility_on_death_avg", "REAL"),
+    ("he_thrown", "INTEGER"),
+    ("he_foes_damage_avg", "REAL"),
+    ("he_friends_damage_avg", "REAL"),
+    ("molotov_thrown", "INTEGER"),
+    ("smoke_thrown", "INTEGER"),
+    ("flashbang_thrown", "INTEGER"),
+    ("flashbang_hit_foe", "INTEGER"),
+    ("flashbang_hit_friend", "INTEGER"),
+    ("flashbang_leading_to_kill", "INTEGER"),
+    ("flashbang_hit_foe_avg_duration", "REAL"),
+    ("flash_assist", "INTEGER"),
+
+    ("counter_strafing_shots_all", "INTEGER"),
+    ("counter_strafing_shots_good", "INTEGER"),
+    ("counter_strafing_shots_bad", "INTEGER"),
+    ("counter_strafing_shots_good_ratio", "REAL"),
+
+    ("trade_kill_opportunities", "INTEGER"),
+    ("trade_kill_attempts", "INTEGER"),
+    ("trade_kills_succeed", "INTEGER"),
+    ("trade_kill_attempts_percentage", "REAL"),
+    ("trade_kills_success_percentage", "REAL"),
+    ("trade_kill_opportunities_per_round", "REAL"),
+
+    ("traded_death_opportunities", "INTEGER"),
+    ("traded_death_attempts", "INTEGER"),
+    ("traded_deaths_succeed", "INTEGER"),
+    ("traded_death_attempts_percentage", "REAL"),
+    ("traded_deaths_success_percentage", "REAL"),
+    ("traded_deaths_opportunities_per_round", "REAL"),
+
+    ("multi1k", "INTEGER"),
+    ("multi2k", "INTEGER"),
+    ("multi3k", "INTEGER"),
+    ("multi4k", "INTEGER"),
+    ("multi5k", "INTEGER"),
+
+    ("leetify_rating", "REAL"),
+    ("ct_leetify_rating", "REAL"),
+    ("t_leetify_rating", "REAL"),
+)
+
+COLUMNS = tuple(name for name, _ in FIELDS)
+
+COLUMN_INDEX = {name: i for i, name in enumerate(COLUMNS)}
+
+# parse_match fills these positionally, everything after them is read from the stats entry
+_MATCH_LEVEL = ("match_id", "steam64_id", "finished_at", "data_source", "data_source_match_id", "map_name",
+                "has_banned_player", "initial_team_number", "team_score", "enemy_team_score", "win")
+if COLUMNS[:len(_MATCH_LEVEL)] != _MATCH_LEVEL:
+    raise RuntimeError("FIELDS must start with the match level columns in parse_match order")
+_STAT_NAMES = COLUMNS[len(_MATCH_LEVEL):]
+
+def iso_to_unix(ts: str) -> int:
+    return int(datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp())
+
+class PlayerRow:
+    """One match_history row. row["kd_ratio"] reads like a dict, but it is one tuple."""
+    __slots__ = ("values",)
+
+    def __init__(self, values: tuple):
+        self.values = values
+
+    def __getitem__(self, name: str):
+        return self.values[COLUMN_INDEX[name]]
+
+    def get(self, name: str, default=None):
+        index = COLUMN_INDEX.get(name)
+        return self.values[index] if index is not None else default
+
+class Match:
+    __slots__ = ("id", "finished_at", "map_name", "rows", "archive")
+
+    def __init__(self, id: str, finished_at: int, map_name: str, rows: tuple[tuple, ...], archive: tuple | None = None):
+        self.id = id
+        self.finished_at = finished_at
+        self.map_name = map_name
+        self.rows = rows
+        self.archive = archive
+
+    def player(self, steam64_id: str) -> PlayerRow | None:
+        for row in self.rows:
+            if row[1] == steam64_id:
+                return PlayerRow(row)
+        return None
+
+def parse_match(raw: dict, archive: tuple | None = None) -> Match:
+    """
+    Turn one Leetify match into a Match with one row per player. `archive`
+    is the packed payload (archive.pack) for match_archive.
+    """
+    match_id = raw["id"]
+    finished_at = iso_to_unix(raw["finished_at"])
+    shared = (finished_at, raw["data_source"], raw.get("data_source_match_id"), raw["map_name"], int(raw["has_banned_player"]))
+    team_scores = {team["team_number"]: team["score"] for team in raw.get("team_scores", [])}
+
+    rows = []
+    for stats in raw["stats"]:
+        initial_team = stats.get("initial_team_number")
+        team_score = team_scores.get(initial_team)
+        enemy_score = None
+        win = None
+        if team_score is not None and len(team_scores) == 2:
+            enemy_score = next(score for team, score in team_scores.items() if team != initial_team)
+            win = int(team_score > enemy_score)
+
+        rows.append((
+            match_id, stats.get("steam64_id"), *shared, initial_team, team_score, enemy_score, win,
+            *map(stats.get, _STAT_NAMES),
+        ))
+    return Match(match_id, finished_at, raw["map_name"], tuple(rows), archive)
+
+def parse_matches(data: list[dict]) -> list[Match]:
+    """
+    Parse a decoded /v3/profile/matches response. The list is emptied as it
+    goes, so each raw dict can be freed as soon as its Match exists.
+    """
+    data.reverse()
+    matches = []
+    while data:
+        raw = data.pop()
+        matches.append(parse_match(raw, pack(dumps(raw))))
+    return matches
+
+def decode_matches(body: bytes) -> list[Match]:
+    return parse_matches(loads(body))
@@ -0,0 +1,106 @@
+"""
+Poll schedule helper
+
+Each player gets their own next poll time, picked from an hour-of-week
+profile of when their past matches finished: every few minutes during a
+session or the hours they usually play, hourly otherwise, but never past
+the start of their next usual hour.
+"""
+
+import logging
+import time
+
+from utils.database import get_activity_rows
+
+log = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 168
+LOOKBACK_WEEKS = 12
+
+SESSION_INTERVAL = 3 * 60      # a match finished recently, the next one is likely
+ACTIVE_INTERVAL = 5 * 60       # an hour they usually play in
+DEFAULT_INTERVAL = 15 * 60     # occasionally play now
+IDLE_INTERVAL = 60 * 60        # rarely or never play now
+SESSION_WINDOW = 75 * 60      # how long after a match we still call it a session
+
+ACTIVE_RATE = 0.5   # matches per week in this hour and the next
+DEFAULT_RATE = 0.15
+
+def hour_of_week(ts: float) -> int:
+    """0 is Sunday 00:00 UTC. The Unix epoch was a Thursday, hence the 96."""
+    return (int(ts) // 3600 + 96) % HOURS_PER_WEEK
+
+class Activity:
+    __slots__ = ("hours", "weeks", "last_finished_at")
+
+    def __init__(self, hours: list[int] | None = None, weeks: float = 1.0, last_finished_at: int | None = None):
+        self.hours = hours or [0] * HOURS_PER_WEEK
+        self.weeks = max(weeks, 1.0)
+        self.last_finished_at = last_finished_at
+
+    def rate(self, hour: int) -> float:
+        """Matches per week finishing in this hour of the week or the next."""
+        return (self.hours[hour] + self.hours[(hour + 1) % HOURS_PER_WEEK]) / self.weeks
+
+    def next_poll_at(self, now: float) -> float:
+        if self.last_finished_at and now - self.last_finished_at < SESSION_WINDOW:
+            return now + SESSION_INTERVAL
+
+        rate = self.rate(hour_of_week(now))
+        if rate >= ACTIVE_RATE:
+            return now + ACTIVE_INTERVAL
+        interval = DEFAULT_INTERVAL if rate >= DEFAULT_RATE else IDLE_INTERVAL
+
+        # Do not sleep through the start of an hour they usually play in
+        boundary = (int(now) // 3600 + 1) * 3600
+        while boundary < now + interval:
+            if self.rate(hour_of_week(boundary)) >= ACTIVE_RATE:
+                return boundary
+            boundary += 3600
+        return now + interval
+
+async def get_activity(steamids: list[str], now: float) -> dict[str, Activity]:
+    since = int(now) - LOOKBACK_WEEKS * 7 * 24 * 3600
+    activity: dict[str, Activity] = {}
+    for steam64_id, hour, count, first, last in await get_activity_rows(steamids, since):
+        entry = activity.setdefault(steam64_id, Activity())
+        entry.hours[hour] = count
+        entry.weeks = max(entry.weeks, (now - first) / (7 * 24 * 3600))
+        entry.last_finished_at = max(entry.last_finished_at or 0, last)
+    return activity
+
+class PollScheduler:
+    """Decides which players are due each tick. Players it has not seen yet are due at once."""
+
+    def __init__(self):
+        self._next: dict[str, float] = {}
+
+    def due(self, steamids: list[str], now: float | None = None) -> list[str]:
+        now = time.time() if now is None else now
+        self._next = {steamid: self._next[steamid] for steamid in steamids if steamid in self._next}
+        return [steamid for steamid in steamids if self._next.get(steamid, 0) <= now]
+
+    async def plan(self, steamids: list[str], now: float | None = None):
+        """Pick the next poll time for players that were just polled."""
+        now = time.time() if now is None else now
+        activity = await get_activity(steamids, now)
+        for steamid in steamids:
+            self._next[steamid] = activity.get(steamid, Activity()).next_poll_at(now)
+            log.debug("next poll", extra={"steam64": steamid, "in": round(self._next[steamid] - now)})
+
+    def next_poll_at(self, steamid: str) -> float | None:
+        return self._next.get(steamid)
+
+async def is_quiet(steamids: list[str], now: float | None = None) -> bool:
+    """
+    Nobody on the roster is mid-session or usually plays this hour or the
+    next, so nothing is lost if the writer is busy for a while.
+    """
+    now = time.time() if now is None else now
+    hour = hour_of_week(now)
+    for activity in (await get_activity(steamids, now)).values():
+        if activity.last_finished_at and now - activity.last_finished_at < SESSION_WINDOW:
+            return False
+        if activity.rate(hour) >= DEFAULT_RATE:
+            return False
+    return True
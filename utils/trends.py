@@ -0,0 +1,78 @@
+"""
+Streak and trend helper
+
+Running per-player state that is updated in constant time per match:
+the current win/loss streak, an EWMA of leetify_rating and the ratings of
+the last 50 matches for rolling averages.
+"""
+
+import json
+
+EWMA_ALPHA = 0.2
+WINDOW = 50
+
+def match_result(team_score, enemy_score) -> str | None:
+    if team_score is None or enemy_score is None:
+        return None
+    if team_score > enemy_score:
+        return "win"
+    if team_score < enemy_score:
+        return "loss"
+    return "tie"
+
+class Trend:
+    __slots__ = ("steam64_id", "last_finished_at", "matches", "streak_result",
+                 "streak_length", "ewma_rating", "recent_ratings")
+
+    def __init__(self, steam64_id: str, last_finished_at: int = 0, matches: int = 0,
+                 streak_result: str | None = None, streak_length: int = 0,
+                 ewma_rating: float | None = None, recent_ratings: list | None = None):
+        self.steam64_id = steam64_id
+        self.last_finished_at = last_finished_at
+        self.matches = matches
+        self.streak_result = streak_result
+        self.streak_length = streak_length
+        self.ewma_rating = ewma_rating
+        self.recent_ratings = recent_ratings or []
+
+    def update(self, finished_at: int, result: str | None, rating: float | None):
+        """Fold in one match. Matches must arrive in finished_at order."""
+        self.last_finished_at = finished_at
+        self.matches += 1
+
+        if result is not None:
+            if result == self.streak_result:
+                self.streak_length += 1
+            else:
+                self.streak_result = result
+                self.streak_length = 1
+
+        if rating is not None:
+            if self.ewma_rating is None:
+                self.ewma_rating = rating
+            else:
+                self.ewma_rating += EWMA_ALPHA * (rating - self.ewma_rating)
+            self.recent_ratings.append(rating)
+            if len(self.recent_ratings) > WINDOW:
+                del self.recent_ratings[0]
+
+    def rolling_average(self, n: int) -> float | None:
+        ratings = self.recent_ratings[-n:]
+        return sum(ratings) / len(ratings) if ratings else None
+
+    def streak_text(self) -> str:
+        if not self.streak_result:
+            return "-"
+        return f"{self.streak_result[0].upper()}{self.streak_length}"
+
+    def to_row(self) -> tuple:
+        return (
+            self.steam64_id, self.last_finished_at, self.matches, self.streak_result,
+            self.streak_length, self.ewma_rating, json.dumps(self.recent_ratings),
+        )
+
+    @classmethod
+    def from_row(cls, row) -> "Trend":
+        steam64_id, last_finished_at, matches, streak_result, streak_length, ewma_rating, recent = row
+        return cls(steam64_id, last_finished_at, matches, streak_result,
+                   streak_length, ewma_rating, json.loads(recent))